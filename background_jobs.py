@@ -0,0 +1,70 @@
+import queue
+import threading
+import time
+
+def format_duration(seconds):
+    #Format seconds as H:MM:SS, or M:SS under an hour.
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+class ProgressRate:
+    #Throughput and time remaining of a job, measured from when it started.
+    def __init__(self):
+        self.started = time.monotonic()
+
+    def describe(self, done, total=None, unit="sheets"):
+        #Return e.g. "120/1000 sheets, 35.2 sheets/s, ETA 0:25".
+        text = f"{done}/{total} {unit}" if total else f"{done} {unit}"
+        elapsed = time.monotonic() - self.started
+        if done and elapsed > 0:
+            rate = done / elapsed
+            text += f", {rate:.1f} {unit}/s"
+            if total:
+                text += f", ETA {format_duration((total - done) / rate)}"
+        return text
+
+class BackgroundJob:
+    #Run a function on a worker thread and hand its progress and outcome to the GUI through a queue.
+    # The function is called with progress= and cancel_event= keyword arguments. The GUI drains the queue
+    # with poll() from root.after, so Tk widgets are only ever touched on the main thread. Events are
+    # ("progress", (done, total, message)), then one of ("done", result), ("cancelled", result) or ("error", exception).
+    def __init__(self, function, *args, **kwargs):
+        self.cancel_event = threading.Event()
+        self.events = queue.Queue()
+        self.rate = ProgressRate()
+        self._thread = threading.Thread(target=self._run, args=(function, args, kwargs), daemon=True)
+
+    def start(self):
+        self.rate = ProgressRate()
+        self._thread.start()
+        return self
+
+    def _run(self, function, args, kwargs):
+        try:
+            result = function(*args, progress=self.report, cancel_event=self.cancel_event, **kwargs)
+        except Exception as exception:
+            self.events.put(("error", exception))
+        else:
+            self.events.put(("cancelled" if self.cancel_event.is_set() else "done", result))
+
+    def report(self, done, total=None, message=None):
+        #Queue a progress update; safe to call from any thread.
+        self.events.put(("progress", (done, total, message)))
+
+    def cancel(self):
+        #Ask the job to stop at its next checkpoint.
+        self.cancel_event.set()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def poll(self):
+        #Return the events queued since the last poll, without blocking.
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
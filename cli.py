@@ -0,0 +1,164 @@
+import argparse
+import datetime
+import os
+import sys
+
+# Heavy modules (cv2, pandas, groq, reportlab) are imported inside the subcommands that use them,
+# so --help and small jobs start quickly and no subcommand pays for the GUI.
+
+def _reading_options(args):
+    #Sheet reading keyword arguments shared by the grading subcommands and the grading service.
+    options = {
+        "layout_path": args.layout,
+        "single_pass": args.single_pass,
+        "register": args.register,
+        "threshold_mode": "auto" if args.auto_threshold else "fixed",
+    }
+    if args.variant_sheets:
+        from sheet_layout import VARIANT_LAYOUT_PATH
+        options["layout_path"] = args.layout or VARIANT_LAYOUT_PATH
+    return options
+
+def _grading_options(args):
+    #Keyword arguments for process_main shared by the grading subcommands.
+    options = _reading_options(args)
+    options.update(headless=not args.show, debug_dir=args.debug_dir, profile_path=args.profile)
+    if args.results:
+        options["results_path"] = args.results
+    return options
+
+def command_grade(args):
+    from omr_processing import process_main
+    process_main(args.image, args.answers, process_mode="single", **_grading_options(args))
+    return 0
+
+def command_grade_folder(args):
+    from omr_processing import process_main
+    options = _grading_options(args)
+    if args.watch:
+        process_main(args.folder, args.answers, process_mode="watch", workers=args.workers, idle_timeout=args.idle_timeout, **options)
+    else:
+        process_main(args.folder, args.answers, process_mode="multiple", workers=args.workers, **options)
+    return 0
+
+def command_serve(args):
+    from grading_service import answer_keys_from_paths, serve
+    serve(args.host, args.port, answer_keys=answer_keys_from_paths(args.answers), workers=args.workers, queue_size=args.queue_size, results_path=args.results, **_reading_options(args))
+    return 0
+
+def _write_papers(items, args):
+    #Write the question paper, answer paper and answer key CSV, or args.variants shuffled sets of them.
+    if args.variants > 1:
+        from exam_variants import write_exam_variants
+        written = write_exam_variants(items, args.variants, args.name, args.output_dir, seed=args.seed, workers=args.workers, title=args.title)
+        print(f"{args.variants} variants written to {args.output_dir}; grade with {written['combined_key']}")
+        return
+    from pdf_and_csv_output import save_answers_to_csv, save_mcqs_to_pdf
+    from question_bank import mcqs_from_items
+    mcqs, answers, question_no_answer = mcqs_from_items(items)
+    os.makedirs(args.output_dir, exist_ok=True)
+    save_mcqs_to_pdf(mcqs, os.path.join(args.output_dir, f"PDF_questions_{args.name}.pdf"), header=args.title)
+    save_mcqs_to_pdf(answers, os.path.join(args.output_dir, f"PDF_answers_{args.name}.pdf"), header=args.title)
+    save_answers_to_csv(question_no_answer, os.path.join(args.output_dir, f"CSV_answers_{args.name}.csv"))
+    print(f"Question paper, answer paper and answer key written to {args.output_dir}")
+
+def command_generate(args):
+    from pdf_processing import extract_text_from_pdf
+    from mcq_generation import generate_mcqs_and_answers
+    from question_bank import items_from_question_bank, save_question_bank
+    text = extract_text_from_pdf(args.pdf, use_cache=not args.no_cache, workers=args.extract_workers, ocr=args.ocr)
+    if not text:
+        print("No text extracted from the PDF!", file=sys.stderr)
+        return 1
+    generated = generate_mcqs_and_answers(text, args.count, use_cache=not args.no_cache, mode=args.mode)
+    if generated is None:
+        # The generation error has already been reported
+        print("MCQ generation failed; no papers were written.", file=sys.stderr)
+        return 1
+    mcqs, _, question_no_answer = generated
+    items = items_from_question_bank(mcqs, question_no_answer)
+
+    # Keep the question bank, so the papers can be re-rendered or re-shuffled without calling the model
+    os.makedirs(args.output_dir, exist_ok=True)
+    bank_path = os.path.join(args.output_dir, f"bank_{args.name}.json")
+    save_question_bank(items, bank_path)
+    print(f"Question bank saved to {bank_path}")
+    _write_papers(items, args)
+    return 0
+
+def command_render(args):
+    from question_bank import load_question_bank
+    _write_papers(load_question_bank(args.bank), args)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate MCQ papers from PDFs and grade OMR sheets.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    reading = argparse.ArgumentParser(add_help=False)
+    reading.add_argument("--layout", help="Sheet layout JSON (default: the 30-question sheet)")
+    reading.add_argument("--variant-sheets", action="store_true", help="Sheets have a variant column; grade against a variant answer key")
+    reading.add_argument("--register", action="store_true", help="Correct scanner skew before reading")
+    reading.add_argument("--auto-threshold", action="store_true", help="Adapt thresholds to each sheet")
+    reading.add_argument("--single-pass", action="store_true", help="Share one contour pass across the question boxes")
+
+    grading = argparse.ArgumentParser(add_help=False, parents=[reading])
+    grading.add_argument("--debug-dir", help="Save overlays of flagged sheets to this folder")
+    grading.add_argument("--results", help="SQLite results store (default: omr_results.sqlite)")
+    grading.add_argument("--profile", help="Save per-stage latencies as JSON, or CSV for a .csv path")
+    grading.add_argument("--show", action="store_true", help="Show image windows (default: headless)")
+
+    grade = subcommands.add_parser("grade", parents=[grading], help="Grade one OMR sheet")
+    grade.add_argument("image", help="Scanned sheet (PNG)")
+    grade.add_argument("answers", help="Answer key CSV")
+    grade.set_defaults(func=command_grade)
+
+    grade_folder = subcommands.add_parser("grade-folder", parents=[grading], help="Grade every sheet in a folder")
+    grade_folder.add_argument("folder", help="Folder of PNG sheets, each with a CSV of the same name unless --answers is given")
+    grade_folder.add_argument("--answers", help="Answer key CSV shared by every sheet without its own")
+    grade_folder.add_argument("--workers", type=int, default=1, help="Grading processes")
+    grade_folder.add_argument("--watch", action="store_true", help="Keep grading sheets as they land in the folder")
+    grade_folder.add_argument("--idle-timeout", type=float, help="With --watch, stop after this many idle seconds")
+    grade_folder.set_defaults(func=command_grade_folder)
+
+    serve = subcommands.add_parser("serve", parents=[reading], help="Grade sheets uploaded over HTTP by scanner stations")
+    serve.add_argument("answers", nargs="+", help="Answer key CSVs, chosen by clients with ?key=<file name without .csv>; the first is the default")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on (0.0.0.0 accepts scanners on the network)")
+    serve.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    serve.add_argument("--workers", type=int, help="Grading processes, started and loaded up front (default: all cores)")
+    serve.add_argument("--queue-size", type=int, default=64, help="Sheets accepted at once before answering 429")
+    serve.add_argument("--results", help="Also append every result to this SQLite results store")
+    serve.set_defaults(func=command_serve)
+
+    papers = argparse.ArgumentParser(add_help=False)
+    papers.add_argument("--output-dir", default=".", help="Folder for the papers and keys")
+    papers.add_argument("--name", default=datetime.datetime.now().strftime("%Y_%m_%d-%H_%M_%S"), help="Base file name (default: the current time)")
+    papers.add_argument("--title", help="Header printed on every page")
+    papers.add_argument("--variants", type=int, default=1, help="Number of shuffled exam variants")
+    papers.add_argument("--seed", type=int, help="Shuffle seed, to reproduce the same variants")
+    papers.add_argument("--workers", type=int, help="Rendering processes for variants (default: all cores)")
+
+    generate = subcommands.add_parser("generate", parents=[papers], help="Generate MCQ papers from a PDF")
+    generate.add_argument("pdf", help="Source PDF")
+    generate.add_argument("--count", type=int, required=True, help="Number of MCQs")
+    generate.add_argument("--mode", choices=["structured", "chained"], default="structured", help="Generation mode")
+    generate.add_argument("--no-cache", action="store_true", help="Ignore cached text and model replies")
+    generate.add_argument("--ocr", action="store_true", help="OCR pages without a text layer")
+    generate.add_argument("--extract-workers", type=int, default=1, help="Processes extracting PDF pages")
+    generate.set_defaults(func=command_generate)
+
+    render = subcommands.add_parser("render", parents=[papers], help="Render papers from a saved question bank")
+    render.add_argument("bank", help="Question bank JSON written by generate")
+    render.set_defaults(func=command_render)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError, RuntimeError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+# Default cache location; set OMR_CACHE_DIR to move it
+DEFAULT_CACHE_DIR = os.environ.get("OMR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "omr_mcq"))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+def file_digest(path, block_size=1024 * 1024):
+    #SHA-256 of a file's contents, read in blocks.
+    digest = hashlib.sha256()
+    with open(path, "rb") as cached_file:
+        for block in iter(lambda: cached_file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def key_digest(*parts):
+    #SHA-256 of JSON-serializable key parts, such as (prompt, model, parameters).
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class ContentCache:
+    #On-disk cache of JSON values keyed by content hashes, grouped into namespaces.
+    # Entries written more than max_age_seconds ago are treated as missing and removed, however often they are
+    # read. Once the cache grows past max_bytes, the least recently used entries are evicted down to 90% of it.
+    # An entry's mtime records when it was written and its atime when it was last read. Writes are atomic, so a
+    # crash never leaves a truncated entry, and a disabled cache reads nothing and writes nothing.
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age_seconds=DEFAULT_MAX_AGE_SECONDS, enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self._size = None  # Total bytes on disk, measured on the first write
+
+    def _path(self, namespace, key):
+        return os.path.join(self.directory, namespace, key[:2], f"{key}.json")
+
+    def get(self, namespace, key):
+        #Return the cached value, or None on a miss.
+        if not self.enabled:
+            return None
+        path = self._path(namespace, key)
+        try:
+            written_at = os.path.getmtime(path)
+            if time.time() - written_at > self.max_age_seconds:
+                self._remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as cached_file:
+                value = json.load(cached_file)
+            os.utime(path, (time.time(), written_at))  # Mark as recently used, keeping the write time
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def set(self, namespace, key, value):
+        #Store a JSON-serializable value, evicting old entries if the cache is over its size limit.
+        if not self.enabled:
+            return
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as cached_file:
+                cached_file.write(data)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temporary_path, path)
+        except OSError:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        if self._size is None:
+            self._size = sum(entry[1] for entry in self._entries())
+        else:
+            self._size += len(data) - previous_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        #Yield (path, size, write time, last used time) for every cached entry.
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime, max(stat.st_atime, stat.st_mtime)
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self._size is not None:
+            self._size -= size
+
+    def evict(self):
+        #Remove expired entries, then the least recently used ones until the cache is under 90% of max_bytes.
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda entry: entry[3])
+        self._size = sum(entry[1] for entry in entries)
+        for path, _, written_at, _ in entries:
+            if now - written_at > self.max_age_seconds or self._size > self.max_bytes * 0.9:
+                self._remove(path)
+
+    def clear(self):
+        #Remove every cached entry.
+        for path, _, _, _ in list(self._entries()):
+            self._remove(path)
+        self._size = 0
+
+# Shared default cache, created on first use
+_default_cache = None
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ContentCache()
+    return _default_cache
@@ -0,0 +1,82 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from question_bank import OPTION_LETTERS, items_from_question_bank, mcqs_from_items
+from pdf_and_csv_output import render_papers, save_answers_to_csv
+
+def variant_label(variant_id):
+    #Two-digit variant ID, as printed on the paper and marked in the sheet's variant column.
+    return f"{variant_id:02d}"
+
+def shuffle_item(item, rng):
+    #Return a copy of a question item with its options in a random order and the answer letter remapped.
+    order = list(OPTION_LETTERS)
+    rng.shuffle(order)
+    return {
+        "question": item["question"],
+        "options": {letter: item["options"][source] for letter, source in zip(OPTION_LETTERS, order)},
+        "answer": OPTION_LETTERS[order.index(item["answer"])],
+    }
+
+def make_variants(items, count, seed=None, shuffle_options=True):
+    #Return [(variant ID, items)] for count variants, each with its own question order and option order.
+    # The same seed always gives the same variants, so papers and keys can be regenerated.
+    if not 1 <= count <= 99:
+        raise ValueError("The number of variants must be between 1 and 99.")
+    rng = random.Random(seed)
+    variants = []
+    for variant_id in range(1, count + 1):
+        variant_items = rng.sample(items, len(items))
+        if shuffle_options:
+            variant_items = [shuffle_item(item, rng) for item in variant_items]
+        variants.append((variant_id, variant_items))
+    return variants
+
+def _render_batch(papers):
+    #Render a share of the papers in a worker process.
+    render_papers(papers)
+    return len(papers)
+
+def generate_exam_variants(mcqs, question_no_answer, count, base_filename, output_dir=".", seed=None, workers=None, title=None):
+    #Write count shuffled variants of a generated question bank, given as MCQ lines and (question_no, answer) pairs.
+    # See write_exam_variants for the files written.
+    items = items_from_question_bank(mcqs, question_no_answer)
+    return write_exam_variants(items, count, base_filename, output_dir, seed, workers, title)
+
+def write_exam_variants(items, count, base_filename, output_dir=".", seed=None, workers=None, title=None):
+    #Write count shuffled variants of question items: a question paper, an answer paper and an answer key CSV each.
+    # Every page of a variant's papers carries its variant ID. A combined CSV with variant, question_no and
+    # answer columns lets the OMR grader pick each sheet's key by the variant marked on it. No model calls
+    # are made; the papers are rendered across worker processes.
+    # Returns the paths written, keyed by "question_papers", "answer_papers", "answer_keys" and "combined_key".
+    os.makedirs(output_dir, exist_ok=True)
+    papers = []
+    written = {"question_papers": [], "answer_papers": [], "answer_keys": []}
+    key_rows = []
+    for variant_id, variant_items in make_variants(items, count, seed):
+        label = variant_label(variant_id)
+        header = f"{title} - Variant {label}" if title else f"Variant {label}"
+        variant_mcqs, variant_answers, variant_question_no_answer = mcqs_from_items(variant_items)
+        question_paper = os.path.join(output_dir, f"PDF_questions_{base_filename}_V{label}.pdf")
+        answer_paper = os.path.join(output_dir, f"PDF_answers_{base_filename}_V{label}.pdf")
+        answer_key = os.path.join(output_dir, f"CSV_answers_{base_filename}_V{label}.csv")
+        papers.append((variant_mcqs, question_paper, header))
+        papers.append((variant_answers, answer_paper, f"{header} - Answers"))
+        save_answers_to_csv(variant_question_no_answer, answer_key)
+        key_rows.extend((variant_id, question_no, answer) for question_no, answer in variant_question_no_answer)
+        written["question_papers"].append(question_paper)
+        written["answer_papers"].append(answer_paper)
+        written["answer_keys"].append(answer_key)
+
+    combined_key = os.path.join(output_dir, f"CSV_answers_{base_filename}_variants.csv")
+    save_answers_to_csv(key_rows, combined_key, columns=["variant", "question_no", "answer"])
+    written["combined_key"] = combined_key
+
+    # Split the papers into one interleaved share per worker; each worker builds its page template once
+    workers = min(workers or os.cpu_count() or 1, len(papers))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_render_batch, [papers[index::workers] for index in range(workers)]))
+    else:
+        render_papers(papers)
+    return written
@@ -0,0 +1,359 @@
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import cv2
+import numpy as np
+from omr_processing import load_answer_key, process_single_file_for_folder
+from pipeline_profile import BatchProfile
+from results_store import SHEET_COLUMNS, ResultsStore
+from sheet_layout import load_layout
+
+# Largest request body accepted, so one upload cannot exhaust the server's memory
+DEFAULT_MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+# Sheets kept in the latency window reported by /metrics before it starts afresh
+PROFILE_WINDOW = 10000
+
+def _init_service_worker(layout_path, answer_key_paths):
+    #Load the layout and every answer key once per worker, so no request pays for parsing them.
+    # The pipeline's progress prints are discarded; results go back to the server as JSON.
+    cv2.setNumThreads(1)
+    sys.stdout = open(os.devnull, "w")
+    load_layout(layout_path)
+    for answers_csv_path in answer_key_paths:
+        load_answer_key(answers_csv_path)
+
+def _worker_ready(_):
+    #Warm-up task: returns once a worker has started and run its initializer.
+    time.sleep(0.05)
+    return os.getpid()
+
+def _grade_upload(job):
+    #Decode and grade one uploaded sheet in a pool worker, returning the error message instead of raising.
+    data, answers_csv_path, layout_path, options = job
+    try:
+        decode_started = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise ValueError("The upload is not a readable image")
+        decode_seconds = time.perf_counter() - decode_started
+        summary, answer_rows, timings = process_single_file_for_folder(image, answers_csv_path, layout=load_layout(layout_path), **options)
+        timings["stages"]["upload_decode"] = decode_seconds
+        return (summary, answer_rows, timings), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def parse_multipart(content_type, body):
+    #Return [(file name, bytes)] for every file part of a multipart/form-data body.
+    message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        raise ValueError("Malformed multipart body")
+    uploads = []
+    for part in message.iter_parts():
+        file_name = part.get_filename()
+        if file_name is not None:
+            uploads.append((file_name, part.get_payload(decode=True) or b""))
+    return uploads
+
+def _answer_row(row):
+    #Per-question row with JSON-safe values; a question missing from the key has no correct answer.
+    correct = row["correct_answer"]
+    if isinstance(correct, float) and correct != correct:
+        correct = None
+    return {
+        "question_no": int(row["question_no"]),
+        "correct_answer": None if correct is None else str(correct),
+        "detected_answer": None if row["detected_answer"] is None else str(row["detected_answer"]),
+        "is_correct": bool(row["is_correct"]),
+    }
+
+class GradingService:
+    #Grades uploaded sheets on a pre-warmed process pool, with at most queue_size sheets accepted at once.
+    # answer_keys maps the names clients pass as ?key= to answer key CSVs; the first is the default.
+    # Clients can only choose among these keys, never name a file on the server.
+    def __init__(self, answer_keys, workers=None, queue_size=64, layout_path=None, results_path=None, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES, single_pass=False, register=False, threshold_mode="fixed"):
+        if not answer_keys:
+            raise ValueError("The grading service needs at least one answer key")
+        self.answer_keys = {name: os.path.abspath(path) for name, path in answer_keys.items()}
+        self.default_key = next(iter(self.answer_keys))
+        for answers_csv_path in self.answer_keys.values():
+            load_answer_key(answers_csv_path)  # Fail on a missing or malformed key before serving
+        self.layout_path = layout_path
+        load_layout(layout_path)
+        self.read_options = {"headless": True, "single_pass": single_pass, "register": register, "threshold_mode": threshold_mode}
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.max_upload_bytes = max_upload_bytes
+        self.pool_lock = threading.Lock()
+        self.executor = self._start_pool()
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.store = ResultsStore(results_path) if results_path else None
+        self.started = time.monotonic()
+        self.profile = BatchProfile()
+        self.counts = {"requests": 0, "rejected": 0, "graded": 0, "failed": 0, "pool_restarts": 0}
+
+    def _start_pool(self):
+        #Start the worker processes with the layout and answer keys loaded, waiting until every one is up.
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_service_worker, initargs=(self.layout_path, list(self.answer_keys.values())))
+        # Start every worker now, so the first scans do not wait for process startup
+        list(executor.map(_worker_ready, range(self.workers)))
+        return executor
+
+    def _restart_pool(self, broken_executor):
+        #Replace a pool broken by a crashed worker, once, however many requests saw it break.
+        with self.pool_lock:
+            if self.executor is not broken_executor:
+                return  # Another request already replaced it
+            broken_executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._start_pool()
+        with self.lock:
+            self.counts["pool_restarts"] += 1
+        print("A grading process crashed; the worker pool was restarted.", file=sys.stderr)
+
+    def reserve(self, sheet_count):
+        #Accept sheet_count more sheets if the queue has room for them; False means the client should retry later.
+        with self.lock:
+            if self.in_flight + sheet_count > self.queue_size:
+                return False
+            self.in_flight += sheet_count
+            self.counts["requests"] += 1
+            return True
+
+    def count_rejection(self):
+        #Count one request turned away with 429, whichever check refused it.
+        with self.lock:
+            self.counts["rejected"] += 1
+
+    def release(self, sheet_count):
+        with self.lock:
+            self.in_flight -= sheet_count
+
+    def is_full(self):
+        with self.lock:
+            return self.in_flight >= self.queue_size
+
+    def grade(self, uploads, key_name=None):
+        #Grade [(name, image bytes)] against a registered answer key, returning one result dict per upload.
+        answers_csv_path = self.answer_keys[key_name or self.default_key]
+        started = time.perf_counter()
+        executor = self.executor
+        try:
+            futures = [executor.submit(_grade_upload, (data, answers_csv_path, self.layout_path, self.read_options)) for _, data in uploads]
+            graded = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died mid-sheet, e.g. OpenCV crashing on a hostile upload. The request fails as a whole
+            # and a fresh pool serves the next ones.
+            with self.lock:
+                self.counts["failed"] += len(uploads)
+            self._restart_pool(executor)
+            raise
+        results = []
+        outcomes = []
+        for (name, _), (outcome, error) in zip(uploads, graded):
+            outcomes.append((name, outcome, error))
+            if error is not None:
+                results.append({"name": name, "error": error})
+                continue
+            summary, answer_rows, _ = outcome
+            result = {"name": name}
+            result.update({column: summary.get(key) for key, column in SHEET_COLUMNS.items()})
+            result["answers"] = [_answer_row(row) for row in answer_rows]
+            results.append(result)
+
+        with self.lock:
+            if self.profile.sheet_count >= PROFILE_WINDOW:
+                self.profile = BatchProfile()
+            for name, outcome, error in outcomes:
+                if error is None:
+                    self.counts["graded"] += 1
+                    self.profile.add(outcome[2])
+                else:
+                    self.counts["failed"] += 1
+            self.profile.record("request", time.perf_counter() - started)
+            if self.store is not None:
+                # One commit per request, so a result returned to a scanner is already on disk
+                write_started = time.perf_counter()
+                for name, outcome, error in outcomes:
+                    if error is None:
+                        self.store.add_sheet(outcome[0], outcome[1], name, answers_csv_path)
+                    else:
+                        self.store.add_failure(name, answers_csv_path, error)
+                self.store.flush()
+                self.profile.record("store_write", time.perf_counter() - write_started)
+        return results
+
+    def health(self):
+        with self.lock:
+            return {"status": "ok", "workers": self.workers, "in_flight": self.in_flight, "queue_size": self.queue_size, "answer_keys": list(self.answer_keys)}
+
+    def metrics(self):
+        #Counters since startup plus per-stage latencies (ms) of the recent sheets.
+        with self.lock:
+            uptime = time.monotonic() - self.started
+            profile_elapsed = time.perf_counter() - self.profile.started
+            return {
+                "uptime_seconds": round(uptime, 3),
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queue_size": self.queue_size,
+                "requests": self.counts["requests"],
+                "rejected_requests": self.counts["rejected"],
+                "sheets_graded": self.counts["graded"],
+                "sheets_failed": self.counts["failed"],
+                "pool_restarts": self.counts["pool_restarts"],
+                "sheets_per_second": round(self.profile.sheet_count / profile_elapsed, 3) if profile_elapsed > 0 else None,
+                "stage_unit": "ms",
+                "stages": [row for row in self.profile.summary() if row["kind"] == "stage"],
+                "results_run_id": self.store.run_id if self.store is not None else None,
+            }
+
+    def close(self):
+        with self.pool_lock:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.store is not None:
+            self.store.close()
+
+class GradingHandler(BaseHTTPRequestHandler):
+    #POST /grade with an image body grades one sheet; a multipart/form-data body grades every file in it.
+    # GET /health and GET /metrics report the service state as JSON.
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/health":
+            self._send(200, self.server.service.health())
+        elif path == "/metrics":
+            self._send(200, self.server.service.metrics())
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.rstrip("/") != "/grade":
+            self._reject(404, f"Unknown path {self.path}")
+            return
+        key_name = query.get("key", [None])[0]
+        if key_name is not None and key_name not in service.answer_keys:
+            self._reject(400, f"Unknown answer key {key_name}; known keys: {', '.join(service.answer_keys)}")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self._reject(400, "Content-Length must be a number of bytes")
+            return
+        if length <= 0:
+            self._reject(411, "A Content-Length and a non-empty body are required")
+            return
+        if length > service.max_upload_bytes:
+            self._reject(413, f"Uploads are limited to {service.max_upload_bytes} bytes")
+            return
+        # Refuse before reading the body when the queue is already full
+        if service.is_full():
+            self._queue_full(body_read=False)
+            return
+
+        body = self.rfile.read(length)
+        content_type = self.headers.get("Content-Type", "")
+        batch = content_type.startswith("multipart/form-data")
+        if batch:
+            try:
+                uploads = parse_multipart(content_type, body)
+            except ValueError as error:
+                self._send(400, {"error": str(error)})
+                return
+            if not uploads:
+                self._send(400, {"error": "The multipart body has no file parts"})
+                return
+            if len(uploads) > service.queue_size:
+                self._send(413, {"error": f"Batches are limited to {service.queue_size} sheets"})
+                return
+        else:
+            uploads = [(query.get("name", ["upload"])[0], body)]
+
+        if not service.reserve(len(uploads)):
+            self._queue_full(body_read=True)
+            return
+        try:
+            results = service.grade(uploads, key_name)
+        except BrokenProcessPool:
+            self._send(503, {"error": "A grading process crashed on this request; the workers were restarted"})
+            return
+        finally:
+            service.release(len(uploads))
+        if batch:
+            self._send(200, {"results": results})
+        else:
+            self._send(422 if "error" in results[0] else 200, results[0])
+
+    def _queue_full(self, body_read):
+        #Answer 429 and count the rejection; body_read tells whether the request body was already consumed.
+        self.server.service.count_rejection()
+        message = "The grading queue is full; retry shortly"
+        if body_read:
+            self._send(429, {"error": message})
+        else:
+            self._reject(429, message)
+
+    def _reject(self, status, message):
+        #Answer without reading the body, then close the connection, since the unread body cannot be skipped.
+        self.close_connection = True
+        self._send(status, {"error": message})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status in (429, 503):
+            self.send_header("Retry-After", "1")
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_grading_service(host="127.0.0.1", port=0, **service_options):
+    #Start the grading service on a background thread and return (server, base_url).
+    # service_options are passed to GradingService; call stop_grading_service(server) to stop it.
+    service = GradingService(**service_options)
+    server = ThreadingHTTPServer((host, port), GradingHandler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def stop_grading_service(server):
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+
+def answer_keys_from_paths(paths):
+    #Name each answer key CSV by its file name without the extension, as clients select it with ?key=.
+    answer_keys = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in answer_keys:
+            raise ValueError(f"Two answer keys are named {name}")
+        answer_keys[name] = path
+    return answer_keys
+
+def serve(host="127.0.0.1", port=8080, **service_options):
+    #Run the grading service in the foreground until interrupted.
+    server, base_url = start_grading_service(host, port, **service_options)
+    service = server.service
+    print(f"Grading service listening on {base_url} with {service.workers} workers; answer keys: {', '.join(service.answer_keys)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_grading_service(server)
@@ -0,0 +1,123 @@
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Chat completions route of the Groq API, relative to the base URL
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+# Question numbers shared by every reply, so stub questions are unique
+_question_numbers = itertools.count(1)
+
+def stub_questions(count, invalid_rate=0.0):
+    #Return a JSON reply with count questions, a share of which break the schema.
+    questions = []
+    for _ in range(count):
+        question_no = next(_question_numbers)
+        item = {
+            "question": f"Stub question {question_no}?",
+            "options": {letter: f"Option {letter} of {question_no}" for letter in "ABCD"},
+            "answer": "ABCD"[question_no % 4],
+        }
+        if random.random() < invalid_rate:
+            item["answer"] = "E"
+        questions.append(item)
+    return json.dumps({"questions": questions})
+
+def stub_json_reply(prompt, invalid_rate=0.0):
+    #Return a canned JSON reply to a structured generation or correction prompt.
+    match = re.search(r"Return exactly (\d+) questions", prompt)
+    count = int(match.group(1)) if match else 1
+    if prompt.startswith("Correct the following"):
+        return stub_questions(count)
+    return stub_questions(count, invalid_rate)
+
+def stub_reply(prompt):
+    #Return a canned reply shaped like the model's answer to each generation prompt.
+    match = re.match(r"Generate (\d+) multiple-choice questions", prompt)
+    if match:
+        lines = []
+        for question_no in range(1, int(match.group(1)) + 1):
+            lines.append(f"{question_no}. Stub question {question_no}?")
+            lines.extend(f"{option}) Option {option.upper()}" for option in "abcd")
+        return "\n".join(lines)
+    question_count = len(re.findall(r"Stub question \d+", prompt))
+    if prompt.startswith("Provide the correct answers"):
+        return "\n".join(f"{question_no}. a) Option A" for question_no in range(1, question_count + 1))
+    if prompt.startswith("Format the following answers"):
+        answer_count = len(re.findall(r"\d+\. a\)", prompt))
+        return "question_no,answer\n" + "\n".join(f"{question_no},a" for question_no in range(1, answer_count + 1))
+    return "OK"
+
+class StubHandler(BaseHTTPRequestHandler):
+    #Serve chat completions with a configurable delay, share of transient failures and share of invalid JSON items.
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if self.path.rstrip("/") != COMPLETIONS_PATH:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.failure_rate:
+            self._send(random.choice((429, 503)), {"error": {"message": "Stub transient failure"}})
+            return
+        prompt = body["messages"][-1]["content"]
+        if body.get("response_format", {}).get("type") == "json_object":
+            content = stub_json_reply(prompt, server.invalid_rate)
+        else:
+            content = stub_reply(prompt)
+        self._send(200, {
+            "id": f"stub-{server.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 0, "total_tokens": len(prompt) // 4},
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Keep test output quiet
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0, invalid_rate=0.0):
+    #Start a stub chat completions server on a background thread and return (server, base_url).
+    # Point the MCQ engine at it with base_url=... or GROQ_BASE_URL; call server.shutdown() to stop it.
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.invalid_rate = invalid_rate
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Groq chat completions API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each reply")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with 429/503")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Share of JSON question items that fail validation")
+    args = parser.parse_args()
+    server, base_url = start_stub_server(port=args.port, latency=args.latency, failure_rate=args.failure_rate, invalid_rate=args.invalid_rate)
+    print(f"Stub server listening on {base_url}; set GROQ_BASE_URL={base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
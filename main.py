@@ -1,26 +1,112 @@
 import tkinter as tk
-from tkinter import filedialog
+from tkinter import filedialog, ttk
 from pdf_processing import extract_text_from_pdf  # Function to extract text from a PDF
 from mcq_generation import generate_mcqs_and_answers  # Function to generate MCQs and answers
 from pdf_and_csv_output import save_mcqs_to_pdf, save_answers_to_csv  # Functions to save data to PDF and CSV
 from omr_processing import process_main  # Function to process OMR sheets
+from exam_variants import generate_exam_variants  # Shuffled papers with matching answer keys
+from sheet_layout import VARIANT_LAYOUT_PATH  # Sheet layout with an exam variant column
+from background_jobs import BackgroundJob  # Runs long jobs off the Tk main thread
 import datetime
-import pkg_resources
+import os
 
 
+# Main window, created by main()
+root = None
+
 def generate_unique_filename():
     #Generate a unique filename using the current date and time.
     current_time = datetime.datetime.now().strftime("%Y_%m_%d-%H_%M_%S")  # Format the date and time
     return f"{current_time}"
 
+def start_job(job, progress_bar, progress_label, on_finish, unit="sheets", cancel_button=None):
+    #Start a background job and show its progress until it finishes; on_finish(kind, payload) runs on the main thread.
+    progress_bar.config(mode="indeterminate", value=0)
+    progress_bar.start(10)
+    progress_label.config(text="Starting...", fg="black")
+    if cancel_button is not None:
+        cancel_button.config(state="normal", command=job.cancel)
+
+    def finish(kind, payload):
+        progress_bar.stop()
+        if kind == "done":
+            progress_bar.config(mode="determinate", maximum=1, value=1)
+        if cancel_button is not None:
+            cancel_button.config(state="disabled")
+        on_finish(kind, payload)
+
+    job.start()
+    root.after(100, poll_job, job, progress_bar, progress_label, finish, unit)
+
+def poll_job(job, progress_bar, progress_label, finish, unit):
+    #Apply a background job's queued events to its widgets, then poll again until the job ends.
+    if not progress_bar.winfo_exists():
+        job.cancel()  # The window was closed; stop the job at its next checkpoint
+        return
+    for kind, payload in job.poll():
+        if kind != "progress":
+            finish(kind, payload)
+            return
+        done, total, message = payload
+        if total:
+            if str(progress_bar.cget("mode")) != "determinate":
+                progress_bar.stop()
+                progress_bar.config(mode="determinate")
+            progress_bar.config(maximum=total, value=done)
+        progress_label.config(text=message or job.rate.describe(done, total, unit))
+    root.after(100, poll_job, job, progress_bar, progress_label, finish, unit)
+
+def generate_question_papers(pdf_path, num_mcqs, variant_count=1, use_cache=True, ocr=False, *, progress, cancel_event):
+    #Extract a PDF, generate MCQs and write the question papers and answer keys; returns a status message.
+    # Runs as a background job: progress reports each step and cancel_event is checked between steps.
+    steps = 3
+    progress(0, steps, "Extracting text from the PDF...")
+    text = extract_text_from_pdf(pdf_path, use_cache=use_cache, ocr=ocr)
+    if not text:
+        raise ValueError("No text extracted from the PDF!")
+    if cancel_event.is_set():
+        return None
+
+    # Generate MCQs, answers, and a formatted question-answer list
+    progress(1, steps, "Generating questions...")
+    generated = generate_mcqs_and_answers(text, num_mcqs, use_cache=use_cache)
+    if generated is None:
+        # The generation error has already been reported
+        raise ValueError("Failed to generate MCQs or answers!")
+    mcqs, answers, formatted_question_no_answer = generated
+    if not mcqs or not answers:
+        raise ValueError("Failed to generate MCQs or answers!")
+    if cancel_event.is_set():
+        return None
+
+    # Generate unique filenames for the output files
+    progress(2, steps, "Writing question papers...")
+    base_filename = generate_unique_filename()
+    if variant_count > 1:
+        # Shuffled variants, each with its own papers and key, plus one combined key for grading
+        written = generate_exam_variants(mcqs, formatted_question_no_answer, variant_count, base_filename)
+        return f"{variant_count} variants generated; grade with {written['combined_key']}"
+    mcq_filename = f"PDF_questions_{base_filename}.pdf"
+    answer_pdf_filename = f"PDF_answers_{base_filename}.pdf"
+    answer_csv_filename = f"CSV_answers_{base_filename}.csv"
+
+    # Save the MCQs, answers, and formatted question-answer list to files
+    save_mcqs_to_pdf(mcqs, mcq_filename)
+    save_mcqs_to_pdf(answers, answer_pdf_filename)
+    save_answers_to_csv(formatted_question_no_answer, answer_csv_filename)
+    return "MCQs and Answer Sheet generated successfully!"
+
 def pdf_and_mcq_interface():
     #Open a window for uploading a PDF and specifying the number of MCQs.
     pdf_window = tk.Toplevel(root)  # Create a new top-level window
     pdf_window.title("Upload PDF and Specify MCQs")  # Set the title of the window
-    pdf_window.geometry("400x400")  # Set the size of the window
+    pdf_window.geometry("400x650")  # Set the size of the window
     pdf_window.configure(bg="white")  # Set the background color of the window
     mcq_entry = tk.StringVar()  # Variable to store the number of MCQs entered by the user
     pdf_file_path = tk.StringVar()  # Variable to store the path of the uploaded PDF file
+    reuse_cached_results = tk.BooleanVar(value=True)  # Skip extraction and API calls for PDFs seen before
+    ocr_scanned_pages = tk.BooleanVar(value=False)  # Read pages without a text layer with local OCR
+    variant_count = tk.IntVar(value=1)  # Number of shuffled exam variants to write
 
     def validate_mcq():
         #Check if the number of MCQs entered is valid.
@@ -56,40 +142,43 @@ def pdf_and_mcq_interface():
             status_label.config(text="PDF upload cancelled. Please upload again.", fg="red")
 
     def process_pdf():
-        #Process the uploaded PDF and generate MCQs and answers.
+        #Process the uploaded PDF and generate MCQs and answers on a background thread.
         try:
             num_mcqs = int(mcq_entry.get())
-            if not pdf_file_path.get():
-                status_label.config(text="No PDF file uploaded!", fg="red")
-                return
-
-            text = extract_text_from_pdf(pdf_file_path.get())
-            if not text:
-                status_label.config(text="No text extracted from the PDF!", fg="red")
-                return
-
-            # Generate MCQs, answers, and a formatted question-answer list
-            mcqs, answers, formatted_question_no_answer = generate_mcqs_and_answers(text, num_mcqs)
-            if not mcqs or not answers:
-                status_label.config(text="Failed to generate MCQs or answers!", fg="red")
-                return
-
-            # Generate unique filenames for the output files
-            base_filename = generate_unique_filename()
-            mcq_filename = f"PDF_questions_{base_filename}.pdf"
-            answer_pdf_filename = f"PDF_answers_{base_filename}.pdf"
-            answer_csv_filename = f"CSV_answers_{base_filename}.csv"
-
-            # Save the MCQs, answers, and formatted question-answer list to files
-            save_mcqs_to_pdf(mcqs, mcq_filename)
-            save_mcqs_to_pdf(answers, answer_pdf_filename)
-            save_answers_to_csv(formatted_question_no_answer, answer_csv_filename)
+        except ValueError:
+            status_label.config(text="Invalid MCQ number. Enter a number between 1 and 30.", fg="red")
+            return
+        if not pdf_file_path.get():
+            status_label.config(text="No PDF file uploaded!", fg="red")
+            return
+        # Read every setting before disabling anything, so a bad value leaves the window usable
+        try:
+            variants = variant_count.get()
+        except tk.TclError:
+            variants = 0
+        if not 1 <= variants <= 99:
+            status_label.config(text="Exam variants must be a number between 1 and 99.", fg="red")
+            return
+        use_cache = reuse_cached_results.get()
+        ocr = ocr_scanned_pages.get()
+
+        def finished(kind, payload):
+            process_pdf_button.config(state="normal")
+            if kind == "done":
+                progress_label.config(text="")
+                status_label.config(text=payload, fg="green")
+            elif kind == "cancelled":
+                progress_label.config(text="")
+                status_label.config(text="Cancelled.", fg="red")
+            else:
+                # Handle any errors and update the status label
+                progress_label.config(text="")
+                status_label.config(text=f"An error occurred: {payload}", fg="red")
 
-            # Update the status label to indicate success
-            status_label.config(text="MCQs and Answer Sheet generated successfully!", fg="green")
-        except Exception as e:
-            # Handle any errors and update the status label
-            status_label.config(text=f"An error occurred: {e}", fg="red")
+        process_pdf_button.config(state="disabled")
+        status_label.config(text="")
+        job = BackgroundJob(generate_question_papers, pdf_file_path.get(), num_mcqs, variants, use_cache=use_cache, ocr=ocr)
+        start_job(job, progress_bar, progress_label, finished, unit="steps", cancel_button=cancel_button)
 
     # UI elements for the PDF and MCQ interface
     mcq_label = tk.Label(pdf_window, text="Enter number of MCQs (1-30):", bg="white", font=("Helvetica", 12), fg="black")
@@ -102,9 +191,22 @@ def pdf_and_mcq_interface():
     upload_pdf_button = tk.Button(pdf_window, text="Upload PDF", command=upload_pdf, bg="black", fg="white", font=("Helvetica", 12), padx=10, pady=5, state="disabled")
     upload_pdf_button.pack(pady=20)  # Add padding around the button
 
+    tk.Checkbutton(pdf_window, text="Reuse cached results", variable=reuse_cached_results, bg="white", font=("Helvetica", 10)).pack(pady=5)
+    tk.Checkbutton(pdf_window, text="OCR scanned pages", variable=ocr_scanned_pages, bg="white", font=("Helvetica", 10)).pack(pady=5)
+    tk.Label(pdf_window, text="Exam variants:", bg="white", font=("Helvetica", 10), fg="black").pack(pady=5)
+    tk.Spinbox(pdf_window, from_=1, to=99, textvariable=variant_count, width=5, justify="center").pack(pady=5)
+
     process_pdf_button = tk.Button(pdf_window, text="Process PDF", command=process_pdf, bg="black", fg="white", font=("Helvetica", 12, "bold"), padx=10, pady=5, state="disabled")
     process_pdf_button.pack(pady=30)  # Add padding around the button
 
+    # Progress of the running job
+    progress_bar = ttk.Progressbar(pdf_window, length=300)
+    progress_bar.pack(pady=5)
+    progress_label = tk.Label(pdf_window, text="", bg="white", font=("Helvetica", 10), fg="black")
+    progress_label.pack(pady=5)
+    cancel_button = tk.Button(pdf_window, text="Cancel", bg="black", fg="white", font=("Helvetica", 10), padx=10, state="disabled")
+    cancel_button.pack(pady=5)
+
     status_label = tk.Label(pdf_window, text="", bg="white", font=("Helvetica", 10), fg="black")
     status_label.pack(pady=20)  # Add padding around the label
 
@@ -113,22 +215,67 @@ def open_omr_interface():
     #Open a window for processing OMR sheets.
     omr_window = tk.Toplevel(root)
     omr_window.title("Process OMR")
-    omr_window.geometry("400x400")
+    omr_window.geometry("400x780")
     omr_window.configure(bg="white")
+    headless_mode = tk.BooleanVar(value=False)  # Skip all image windows while grading
+    save_flagged_overlays = tk.BooleanVar(value=False)  # Write overlays for flagged sheets to disk
+    worker_count = tk.IntVar(value=1)  # Number of processes used to grade a folder
+    correct_skew = tk.BooleanVar(value=False)  # Align skewed scans before reading them
+    auto_thresholds = tk.BooleanVar(value=False)  # Adapt thresholds to faint pencil or dark paper
+    variant_sheets = tk.BooleanVar(value=False)  # Sheets carry an exam variant column
+    shared_answers_path = tk.StringVar(value="")  # Answer key for folder sheets without a CSV of their own
+
+    def layout_path():
+        # Sheet layout selected in the interface.
+        return VARIANT_LAYOUT_PATH if variant_sheets.get() else None
+
+    def threshold_mode():
+        # Thresholding mode selected in the interface.
+        return "auto" if auto_thresholds.get() else "fixed"
+
+    def debug_dir():
+        # Directory for the overlays of flagged sheets, if enabled.
+        return "debug_overlays" if save_flagged_overlays.get() else None
+
+    def select_shared_answer_key():
+        # Choose one answer key CSV, e.g. the combined variants CSV, for every folder sheet without its own.
+        # Cancelling the dialog clears the choice, so each sheet needs its own CSV again.
+        file_path = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")], title="Select Shared Answer CSV File")
+        shared_answers_path.set(file_path or "")
+        shared_answers_label.config(text=f"Shared answer key: {os.path.basename(file_path)}" if file_path else "No shared answer key")
 
     def process_folder():
-        # Process a folder containing both images and answer CSV files.
+        # Process a folder containing both images and answer CSV files on a background thread.
+        # Image windows need the Tk main thread, so background runs are always headless.
+        # Read every setting before disabling anything, so a bad value leaves the window usable
+        try:
+            workers = worker_count.get()
+        except tk.TclError:
+            workers = 0
+        if workers < 1:
+            status_label.config(text="Worker processes must be a number of at least 1.", fg="red")
+            return
         folder_path = filedialog.askdirectory(title="Select Folder Containing Images and CSVs")
-        if folder_path:
-            try:
-                process_main(folder_path, None, process_mode="multiple")
-                status_label.config(text="Folder processing completed successfully.", fg="green")
-            except ValueError as ve:
-                status_label.config(text=f"Error: {ve}", fg="red")
-            except Exception as e:
-                status_label.config(text=f"Unexpected error: {e}", fg="red")
-        else:
+        if not folder_path:
             status_label.config(text="No folder selected! Please try again.", fg="red")
+            return
+        options = dict(debug_dir=debug_dir(), workers=workers, register=correct_skew.get(), threshold_mode=threshold_mode(), layout_path=layout_path())
+
+        def finished(kind, payload):
+            folder_button.config(state="normal")
+            if kind == "done":
+                status_label.config(text="Folder processing completed successfully.", fg="green")
+            elif kind == "cancelled":
+                status_label.config(text="Cancelled; results graded so far were saved.", fg="red")
+            elif isinstance(payload, ValueError):
+                status_label.config(text=f"Error: {payload}", fg="red")
+            else:
+                status_label.config(text=f"Unexpected error: {payload}", fg="red")
+
+        folder_button.config(state="disabled")
+        status_label.config(text="")
+        job = BackgroundJob(process_main, folder_path, shared_answers_path.get() or None, process_mode="multiple", headless=True, **options)
+        start_job(job, progress_bar, progress_label, finished, cancel_button=cancel_button)
 
     def process_file_interface():
         # Open the interface for processing individual OMR sheets and CSV files.
@@ -173,11 +320,27 @@ def open_omr_interface():
             if not omr_file_path.get() or not csv_file_path.get():
                 omr_status_label.config(text="Ensure both OMR and CSV files are uploaded!", fg="red")
                 return
-            try:
-                process_main(omr_file_path.get(), csv_file_path.get(), process_mode="single")
-                omr_status_label.config(text="OMR processing completed successfully!", fg="green")
-            except Exception as e:
-                omr_status_label.config(text=f"Error during processing: {e}", fg="red")
+            options = dict(process_mode="single", debug_dir=debug_dir(), register=correct_skew.get(), threshold_mode=threshold_mode(), layout_path=layout_path())
+            if not headless_mode.get():
+                # Image windows need the Tk main thread, so a run that shows them stays in the foreground
+                try:
+                    process_main(omr_file_path.get(), csv_file_path.get(), headless=False, **options)
+                    omr_status_label.config(text="OMR processing completed successfully!", fg="green")
+                except Exception as e:
+                    omr_status_label.config(text=f"Error during processing: {e}", fg="red")
+                return
+
+            def finished(kind, payload):
+                process_button.config(state="normal")
+                file_progress_label.config(text="")
+                if kind == "done":
+                    omr_status_label.config(text="OMR processing completed successfully!", fg="green")
+                else:
+                    omr_status_label.config(text=f"Error during processing: {payload}", fg="red")
+
+            process_button.config(state="disabled")
+            job = BackgroundJob(process_main, omr_file_path.get(), csv_file_path.get(), headless=True, **options)
+            start_job(job, file_progress_bar, file_progress_label, finished)
 
         tk.Button(file_window, text="Upload OMR Sheet", command=upload_omr_sheet, bg="black", fg="white", font=("Helvetica", 12), padx=10, pady=5).pack(pady=10)
 
@@ -187,50 +350,81 @@ def open_omr_interface():
         process_button = tk.Button(file_window, text="Process", command=process_file, bg="black", fg="white", font=("Helvetica", 12, "bold"), padx=10, pady=5, state="disabled")
         process_button.pack(pady=10)
 
+        file_progress_bar = ttk.Progressbar(file_window, length=250)
+        file_progress_bar.pack(pady=5)
+        file_progress_label = tk.Label(file_window, text="", bg="white", font=("Helvetica", 10), fg="black")
+        file_progress_label.pack(pady=5)
+
         omr_status_label = tk.Label(file_window, text="", bg="white", font=("Helvetica", 10), fg="black")
         omr_status_label.pack(pady=20)
 
     # Add buttons for folder and file processing in the OMR interface
-    tk.Button(omr_window, text="Process Folder", command=process_folder, bg="black", fg="white", font=("Helvetica", 12),padx=10, pady=5).pack(pady=20)
+    folder_button = tk.Button(omr_window, text="Process Folder", command=process_folder, bg="black", fg="white", font=("Helvetica", 12),padx=10, pady=5)
+    folder_button.pack(pady=20)
     tk.Button(omr_window, text="Process File", command=process_file_interface, bg="black", fg="white", font=("Helvetica", 12), padx=10, pady=5).pack(pady=10)
 
+    # Options for unattended grading
+    tk.Checkbutton(omr_window, text="Headless mode (no image windows)", variable=headless_mode, bg="white", font=("Helvetica", 10)).pack(pady=5)
+    tk.Checkbutton(omr_window, text="Save overlays of flagged sheets", variable=save_flagged_overlays, bg="white", font=("Helvetica", 10)).pack(pady=5)
+    tk.Checkbutton(omr_window, text="Correct scanner skew", variable=correct_skew, bg="white", font=("Helvetica", 10)).pack(pady=5)
+    tk.Checkbutton(omr_window, text="Automatic thresholds", variable=auto_thresholds, bg="white", font=("Helvetica", 10)).pack(pady=5)
+    tk.Checkbutton(omr_window, text="Sheets have a variant column", variable=variant_sheets, bg="white", font=("Helvetica", 10)).pack(pady=5)
+    tk.Button(omr_window, text="Shared Answer Key for Folder", command=select_shared_answer_key, bg="black", fg="white", font=("Helvetica", 10), padx=10).pack(pady=5)
+    shared_answers_label = tk.Label(omr_window, text="No shared answer key", bg="white", font=("Helvetica", 10), fg="black")
+    shared_answers_label.pack(pady=2)
+    tk.Label(omr_window, text="Worker processes for folders:", bg="white", font=("Helvetica", 10), fg="black").pack(pady=5)
+    tk.Spinbox(omr_window, from_=1, to=os.cpu_count() or 1, textvariable=worker_count, width=5, justify="center").pack(pady=5)
+
+    # Progress of a folder run, with sheets/s and the time remaining
+    progress_bar = ttk.Progressbar(omr_window, length=300)
+    progress_bar.pack(pady=5)
+    progress_label = tk.Label(omr_window, text="", bg="white", font=("Helvetica", 10), fg="black")
+    progress_label.pack(pady=5)
+    cancel_button = tk.Button(omr_window, text="Cancel", bg="black", fg="white", font=("Helvetica", 10), padx=10, state="disabled")
+    cancel_button.pack(pady=5)
+
     # Label to display general status updates
     status_label = tk.Label(omr_window, text="", bg="white", font=("Helvetica", 10), fg="black")
     status_label.pack(pady=20)
 
 
-# Main Application Window
-root = tk.Tk()
-root.title("OMR by Nerds🤓")  # Title of the main application window
-root.geometry("500x500")  # Set the size of the main window
-root.configure(bg="white")  # Set the background color
-
-# Header for the application
-tk.Label(root, text="OMR and PDF Processor", bg="white", font=("Helvetica", 16, "bold"), fg="black").pack(pady=20)
-
-# Button to open the PDF upload and MCQ specification interface
-tk.Button(
-    root,
-    text="Upload PDF & Specify MCQs",
-    command=pdf_and_mcq_interface,
-    bg="black",
-    fg="white",
-    font=("Helvetica", 14),
-    padx=20,
-    pady=10
-).pack(pady=10)
-
-# Button to open the OMR processing interface
-tk.Button(
-    root,
-    text="Process OMR",
-    command=open_omr_interface,
-    bg="black",
-    fg="white",
-    font=("Helvetica", 14),
-    padx=20,
-    pady=10
-).pack(pady=10)
-
-# Run the Tkinter event loop to keep the application running
-root.mainloop()
\ No newline at end of file
+def main():
+    #Build the main application window and run the Tk event loop.
+    global root
+    root = tk.Tk()
+    root.title("OMR by Nerds🤓")  # Title of the main application window
+    root.geometry("500x500")  # Set the size of the main window
+    root.configure(bg="white")  # Set the background color
+
+    # Header for the application
+    tk.Label(root, text="OMR and PDF Processor", bg="white", font=("Helvetica", 16, "bold"), fg="black").pack(pady=20)
+
+    # Button to open the PDF upload and MCQ specification interface
+    tk.Button(
+        root,
+        text="Upload PDF & Specify MCQs",
+        command=pdf_and_mcq_interface,
+        bg="black",
+        fg="white",
+        font=("Helvetica", 14),
+        padx=20,
+        pady=10
+    ).pack(pady=10)
+
+    # Button to open the OMR processing interface
+    tk.Button(
+        root,
+        text="Process OMR",
+        command=open_omr_interface,
+        bg="black",
+        fg="white",
+        font=("Helvetica", 14),
+        padx=20,
+        pady=10
+    ).pack(pady=10)
+
+    # Run the Tkinter event loop to keep the application running
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,312 @@
-from groq import Groq
+import asyncio
+import json
+import math
+import os
+import random
+import re
+from groq import APIConnectionError, AsyncGroq, DefaultAsyncHttpxClient, InternalServerError, RateLimitError
+import httpx
+from text_chunking import allocate_questions, chunk_text
+from content_cache import default_cache, key_digest
+from question_bank import OPTION_LETTERS, mcqs_from_items, validate_mcq_item
 
-def generate_mcqs_and_answers(input_text, num_mcqs):
-    #Generate multiple-choice questions (MCQs) and their answers using the Groq API.
-    # Replace this with your actual API key
-    api_key = "your api"
-    if not api_key:
-        raise ValueError("API key is missing or not set in the environment.")
+# Replace this with your actual API key, or set GROQ_API_KEY in the environment
+API_KEY = os.environ.get("GROQ_API_KEY", "your api")
+MODEL = "llama3-8b-8192"
+
+# Failures that may succeed when the request is sent again (connection errors include timeouts)
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError, asyncio.TimeoutError)
+
+# Shape of a structured generation reply
+MCQ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "options": {
+                        "type": "object",
+                        "properties": {letter: {"type": "string"} for letter in OPTION_LETTERS},
+                        "required": list(OPTION_LETTERS),
+                        "additionalProperties": False,
+                    },
+                    "answer": {"type": "string", "enum": list(OPTION_LETTERS)},
+                },
+                "required": ["question", "options", "answer"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["questions"],
+}
+
+def mcq_prompt(input_text, num_mcqs):
+    return (
+        f"Generate {num_mcqs} multiple-choice questions without answers "
+        f"based on the following text:\n\n{input_text}"
+    )
+
+def answers_prompt(mcqs):
+    return f"Provide the correct answers to the following multiple-choice questions:\n\n{mcqs}"
+
+def format_prompt(answers):
+    return f"Format the following answers into a CSV-like list with question_no and answer (no text, no formatting, just:\n\nquestion_no,answer\n1,a\n2,b\n...):\n\n{answers}"
+
+def structured_prompt(input_text, num_mcqs):
+    return (
+        f"Generate {num_mcqs} multiple-choice questions based on the following text. "
+        f"Return exactly {num_mcqs} questions, each with four options {', '.join(OPTION_LETTERS)} and the letter "
+        f"of the correct option. Reply with a JSON object only, matching this JSON schema:\n"
+        f"{json.dumps(MCQ_SCHEMA)}\n\nText:\n{input_text}"
+    )
+
+def repair_prompt(invalid_items):
+    #Ask for corrected versions of the items that failed validation, without resending the source text.
+    problems = "\n".join(f"{index}. {'; '.join(errors)}" for index, (_, errors) in enumerate(invalid_items, start=1))
+    items = json.dumps({"questions": [item for item, _ in invalid_items]})
+    return (
+        f"Correct the following {len(invalid_items)} multiple-choice questions. Return exactly {len(invalid_items)} "
+        f"questions in the same order. Reply with a JSON object only, matching this JSON schema:\n"
+        f"{json.dumps(MCQ_SCHEMA)}\n\nProblems:\n{problems}\n\nQuestions:\n{items}"
+    )
 
-    # Initialize the Groq client
-    client = Groq(api_key=api_key)
+def parse_structured_reply(reply):
+    #Return the list of question items in a JSON reply, or an empty list if the reply is not valid JSON.
     try:
-        # Validate the number of MCQs
-        if num_mcqs <= 0:
-            raise ValueError("Number of MCQs must be a positive integer.")
+        payload = json.loads(reply)
+    except json.JSONDecodeError:
+        return []
+    questions = payload.get("questions") if isinstance(payload, dict) else payload
+    return questions if isinstance(questions, list) else []
 
-        # Step 1: Generate MCQs without answers
-        mcq_prompt = (
-            f"Generate {num_mcqs} multiple-choice questions without answers "
-            f"based on the following text:\n\n{input_text}"
-        )
+def _question_words(item):
+    return set(re.findall(r"[a-z0-9]+", item["question"].lower()))
 
-        # Request MCQs from the API
-        mcq_response = client.chat.completions.create(
-            messages=[{"role": "user", "content": mcq_prompt}],
-            model="llama3-8b-8192"
-        )
+def select_distinct_items(items_per_chunk, count, similarity=0.8):
+    #Pick up to count questions, taking one from each chunk in turn and skipping near-duplicates.
+    # Two questions are near-duplicates when their word sets overlap by at least `similarity` (Jaccard).
+    selected, selected_words = [], []
+    queues = [list(items) for items in items_per_chunk]
+    while len(selected) < count and any(queues):
+        for queue in queues:
+            if not queue or len(selected) >= count:
+                continue
+            item = queue.pop(0)
+            words = _question_words(item)
+            if any(len(words & other) / max(len(words | other), 1) >= similarity for other in selected_words):
+                continue
+            selected.append(item)
+            selected_words.append(words)
+    return selected
 
-        if not mcq_response.choices:
-            raise RuntimeError("No MCQs were returned from the API.")
-
-        # Extract and process the MCQs
-        mcqs = mcq_response.choices[0].message.content.strip().split("\n")
-
-        #Step 2: Generate answers for the MCQs
-        # Generate answers for the MCQs
-        prompt_answers = f"Provide the correct answers to the following multiple-choice questions:\n\n{mcqs}"
-
-        # Use Groq's chat completion API to generate the answers
-        answer_response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt_answers
-                }
-            ],
-            model="llama3-8b-8192"
-        )
+def parse_question_no_answer(formatted_output):
+    #Parse "question_no,answer" lines into a list of (question_no, answer) tuples, skipping anything else.
+    question_no_answer = []
+    for line in formatted_output.split("\n"):
+        if "," in line and line.split(",")[0].strip().isdigit():
+            question_no, answer = line.split(",", 1)
+            question_no_answer.append((int(question_no.strip()), answer.strip()))
+    return question_no_answer
 
-        if not answer_response.choices:
-            raise RuntimeError("No answers were returned from the API.")
-
-        # Extract and process the answers
-        answers = answer_response.choices[0].message.content.strip().split("\n")
-        prompt_question_no_answer = f"Format the following answers into a CSV-like list with question_no and answer (no text, no formatting, just:\n\nquestion_no,answer\n1,a\n2,b\n...):\n\n{answers}"
-
-        formatted_response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt_question_no_answer
-                }
-            ],
-            model="llama3-8b-8192"
+class MCQGenerationEngine:
+    #Async MCQ generation sharing one pooled Groq client across every document of a batch.
+    # At most max_concurrency requests are in flight; each one is cut off after timeout seconds and
+    # retried up to max_retries times on connection errors, rate limits and server errors, with
+    # exponential backoff and jitter. base_url (or GROQ_BASE_URL) points the engine at a stub server.
+    # mode="structured" asks for questions, options and answers in one JSON call, re-prompting at most
+    # max_repair_rounds times for the items that fail validation; mode="chained" makes the three
+    # sequential question, answer and formatting calls.
+    # In structured mode, text longer than chunk_tokens is split on page and section boundaries; each chunk
+    # is asked for its share of num_mcqs * oversample candidates in parallel, and the distinct candidates are
+    # picked round-robin across chunks.
+    # Results are cached on disk by a hash of the request (prompt, model, parameters): the raw replies in
+    # chained mode, and in structured mode only complete sets of items that passed validation, so a bad reply
+    # is never replayed. use_cache=False bypasses the cache, for instance to get a fresh set of questions.
+    def __init__(self, api_key=None, base_url=None, model=MODEL, max_concurrency=8, timeout=60.0, max_retries=3, backoff_seconds=1.0, mode="structured", max_repair_rounds=2, chunk_tokens=4000, oversample=1.5, use_cache=True, cache=None):
+        api_key = api_key or API_KEY
+        if not api_key:
+            raise ValueError("API key is missing or not set in the environment.")
+        if mode not in ("structured", "chained"):
+            raise ValueError("Invalid mode. Use 'structured' or 'chained'.")
+        self.mode = mode
+        self.max_repair_rounds = max_repair_rounds
+        self.chunk_tokens = chunk_tokens
+        self.oversample = oversample
+        self.cache = (cache or default_cache()) if use_cache else None
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
         )
+        # Retries are handled here so they share the concurrency limit and the backoff policy
+        self.client = AsyncGroq(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0, http_client=http_client)
 
-        if not formatted_response.choices:
-            raise RuntimeError("No formatted data was returned from the API.")
+    async def __aenter__(self):
+        return self
 
-        # Extract and process the formatted output
-        formatted_output = formatted_response.choices[0].message.content.strip()
-        formatted_lines = formatted_output.split("\n")
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
 
-        # Parse the formatted lines into a list of (question_no, answer) tuples
-        question_no_answer = []
-        for line in formatted_lines:
-            if "," in line and line.split(",")[0].strip().isdigit():
-                question_no, answer = line.split(",", 1)
-                question_no_answer.append((int(question_no.strip()), answer.strip()))
+    async def close(self):
+        await self.client.close()
 
-        # Return the generated MCQs, answers, and formatted data
-        return mcqs, answers, question_no_answer
+    def chat_request(self, prompt, json_reply=False):
+        #Keyword arguments of one chat completion request; json_reply enables the API's JSON mode.
+        request = {"messages": [{"role": "user", "content": prompt}], "model": self.model}
+        if json_reply:
+            request["response_format"] = {"type": "json_object"}
+        return request
 
-    except ValueError as value_error:
-        print(f"Value error: {value_error}")
-    except RuntimeError as runtime_error:
-        print(f"Runtime error: {runtime_error}")
-    except Exception as exception:
+    async def complete(self, prompt, description="responses", json_reply=False, use_cache=True):
+        #Send one chat completion request and return the reply text.
+        # use_cache=False neither reads nor stores the reply, for replies the caller validates and caches itself.
+        request = self.chat_request(prompt, json_reply)
+        cache_key = key_digest(request)
+        use_cache = use_cache and self.cache is not None
+        if use_cache:
+            cached_reply = self.cache.get("llm", cache_key)
+            if cached_reply is not None:
+                return cached_reply
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    response = await asyncio.wait_for(self.client.chat.completions.create(**request), self.timeout)
+                break
+            except RETRYABLE_ERRORS as error:
+                if attempt == self.max_retries:
+                    if isinstance(error, asyncio.TimeoutError):
+                        raise TimeoutError(f"Request for {description} timed out after {self.timeout}s.") from error
+                    raise
+                delay = self.backoff_seconds * 2 ** attempt * random.uniform(0.5, 1.5)
+                print(f"Warning: {type(error).__name__} while requesting {description}; retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+        if not response.choices:
+            raise RuntimeError(f"No {description} were returned from the API.")
+        reply = response.choices[0].message.content.strip()
+        if use_cache:
+            self.cache.set("llm", cache_key, reply)
+        return reply
+
+    async def generate(self, input_text, num_mcqs):
+        #Generate MCQs, their answers and a (question_no, answer) list for one document.
+        if num_mcqs <= 0:
+            raise ValueError("Number of MCQs must be a positive integer.")
+        if self.mode == "structured":
+            return await self.generate_structured(input_text, num_mcqs)
+        # Step 1: Generate MCQs without answers
+        mcqs = (await self.complete(mcq_prompt(input_text, num_mcqs), "MCQs")).split("\n")
+        # Step 2: Generate answers for the MCQs
+        answers = (await self.complete(answers_prompt(mcqs), "answers")).split("\n")
+        # Step 3: Format the answers as question_no,answer lines
+        formatted_output = await self.complete(format_prompt(answers), "formatted data")
+        return mcqs, answers, parse_question_no_answer(formatted_output)
+
+    async def request_items(self, prompt, description):
+        #Send a structured request and return the question items of the reply, split into valid and invalid.
+        # The reply is not cached here: structured_items caches the validated items instead.
+        items = parse_structured_reply(await self.complete(prompt, description, json_reply=True, use_cache=False))
+        valid, invalid = [], []
+        for item in items:
+            errors = validate_mcq_item(item)
+            if errors:
+                invalid.append((item, errors))
+            else:
+                valid.append(item)
+        return valid, invalid
+
+    async def generate_structured(self, input_text, num_mcqs):
+        #Generate MCQs with options and answers in JSON calls, one per chunk of the text.
+        chunks = chunk_text(input_text, self.chunk_tokens)
+        if len(chunks) <= 1:
+            items = await self.structured_items(input_text, num_mcqs)
+        else:
+            items = await self.map_reduce_items(chunks, num_mcqs)
+        if len(items) < num_mcqs:
+            raise RuntimeError(f"Only {len(items)} of {num_mcqs} MCQs passed validation.")
+        return mcqs_from_items(items[:num_mcqs])
+
+    async def map_reduce_items(self, chunks, num_mcqs):
+        #Generate candidates for every chunk in parallel, then keep num_mcqs distinct ones spread over the text.
+        counts = allocate_questions(chunks, math.ceil(num_mcqs * self.oversample))
+        requests = [self.structured_items(chunk, count) for chunk, count in zip(chunks, counts) if count]
+        items_per_chunk = []
+        for result in await asyncio.gather(*requests, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Warning: a text chunk failed and was skipped: {type(result).__name__}: {result}")
+                result = []
+            items_per_chunk.append(result)
+        return select_distinct_items(items_per_chunk, num_mcqs)
+
+    async def structured_items(self, input_text, num_mcqs):
+        #Request num_mcqs questions in one JSON call and re-prompt only for what failed validation.
+        # Returns the valid items, which may be fewer than num_mcqs once the repair rounds run out.
+        # Only a full set of valid items is cached, so a short or malformed reply is asked for again next time.
+        prompt = structured_prompt(input_text, num_mcqs)
+        cache_key = key_digest(self.chat_request(prompt, json_reply=True))
+        if self.cache is not None:
+            cached_items = self.cache.get("mcq_items", cache_key)
+            if cached_items is not None and len(cached_items) >= num_mcqs and not any(map(validate_mcq_item, cached_items)):
+                return cached_items[:num_mcqs]
+        valid, invalid = await self.request_items(prompt, "MCQs")
+        for _ in range(self.max_repair_rounds):
+            missing = num_mcqs - len(valid) - len(invalid)
+            if len(valid) >= num_mcqs:
+                break
+            print(f"Warning: {len(invalid)} invalid and {max(missing, 0)} missing MCQs; asking again for those only.")
+            requests = []
+            if invalid:
+                requests.append(self.request_items(repair_prompt(invalid), "corrected MCQs"))
+            if missing > 0:
+                requests.append(self.request_items(structured_prompt(input_text, missing), "MCQs"))
+            invalid = []
+            for repaired_valid, repaired_invalid in await asyncio.gather(*requests):
+                valid.extend(repaired_valid)
+                invalid.extend(repaired_invalid)
+        if self.cache is not None and len(valid) >= num_mcqs:
+            self.cache.set("mcq_items", cache_key, valid[:num_mcqs])
+        return valid[:num_mcqs]
+
+    async def generate_many(self, documents):
+        #Generate MCQs for many (input_text, num_mcqs) documents concurrently.
+        # Results keep the input order; a failed document yields its exception instead of a result.
+        return await asyncio.gather(
+            *(self.generate(input_text, num_mcqs) for input_text, num_mcqs in documents),
+            return_exceptions=True,
+        )
+
+def _report_error(exception):
+    #Print a generation error the way the interface reports it.
+    if isinstance(exception, ValueError):
+        print(f"Value error: {exception}")
+    elif isinstance(exception, RuntimeError):
+        print(f"Runtime error: {exception}")
+    else:
         print(f"An unexpected error occurred: {exception}")
 
+def generate_mcqs_for_documents(documents, **engine_options):
+    #Generate MCQs for a list of (input_text, num_mcqs) documents concurrently over one client.
+    # Returns one (mcqs, answers, question_no_answer) tuple per document, or None where generation failed.
+    async def run():
+        async with MCQGenerationEngine(**engine_options) as engine:
+            return await engine.generate_many(documents)
 
+    try:
+        results = asyncio.run(run())
+    except Exception as exception:
+        _report_error(exception)
+        return [None] * len(documents)
+    for index, result in enumerate(results):
+        if isinstance(result, BaseException):
+            _report_error(result)
+            results[index] = None
+    return results
+
+def generate_mcqs_and_answers(input_text, num_mcqs, **engine_options):
+    #Generate multiple-choice questions (MCQs) and their answers using the Groq API.
+    return generate_mcqs_for_documents([(input_text, num_mcqs)], **engine_options)[0]
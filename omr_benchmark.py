@@ -0,0 +1,301 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from queue import Empty
+import cv2
+import numpy as np
+from sheet_layout import load_layout
+
+try:
+    import resource  # Peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+# Printed sheet geometry used by the generator, matching the scanned test sheets
+SHEET_SIZE = (1080, 1920)  # (height, width)
+QUESTION_BUBBLE_RADIUS = 7
+ROLL_BUBBLE_RADIUS = 5
+FIRST_ROW_OFFSET = 23  # Distance from the top of a question box to its first row of bubbles
+ROW_PITCH = 27
+PAPER_LEVEL = 245
+PRINT_LEVEL = 90
+INK_LEVEL = 30
+
+def option_centres(column_ranges, radius=QUESTION_BUBBLE_RADIUS):
+    #Return the x centre of each option's bubble: centred in the last 30 pixels of its column range.
+    return {option: (max(start + radius, end - 30) + end) // 2 for option, (start, end) in column_ranges.items()}
+
+def draw_digit_field(image, field_layout, digits):
+    #Print a digit grid (roll number or variant) as empty bubbles and fill in one digit per column.
+    x1, y1, _, _ = field_layout.coordinates
+    columns = field_layout.column_x_coordinates
+    for column_index in range(len(columns) - 1):
+        if column_index in field_layout.fixed_columns:
+            continue
+        centre_x = x1 + (columns[column_index] + columns[column_index + 1]) // 2
+        for digit, row_y in enumerate(field_layout.row_y_coordinates):
+            centre = (centre_x, y1 + row_y)
+            if column_index < len(digits) and digits[column_index] == str(digit):
+                cv2.circle(image, centre, ROLL_BUBBLE_RADIUS, INK_LEVEL, -1)
+            else:
+                cv2.circle(image, centre, ROLL_BUBBLE_RADIUS, PRINT_LEVEL, 1)
+
+def generate_sheet(layout, roll_number, marked_answers, noise=0.0, skew_degrees=0.0, rng=None, variant=None):
+    #Render a synthetic scanned sheet for a layout, with the given roll number and marked answers.
+    # roll_number holds one character per roll column (fixed columns are printed, not marked);
+    # marked_answers maps question number -> option, unmarked questions are left blank.
+    # variant holds one digit per variant column, for layouts with a variant field.
+    # noise is the Gaussian noise standard deviation in grey levels; skew_degrees rotates the scan.
+    rng = rng or np.random.default_rng()
+    height, width = SHEET_SIZE
+    image = np.full((height, width), PAPER_LEVEL, dtype=np.uint8)
+
+    # Printed frame around the content, which registration locates
+    if layout.registration:
+        corners = np.round(np.asarray(layout.registration["reference_corners"])).astype(np.int32)
+        cv2.polylines(image, [corners], True, PRINT_LEVEL, 2)
+
+    # Roll number and variant grids: every digit is printed as an empty bubble, the chosen one is filled in
+    draw_digit_field(image, layout.roll_number, roll_number)
+    if layout.variant is not None:
+        draw_digit_field(image, layout.variant, variant or "")
+
+    # Question boxes: one row of option bubbles per question
+    for box in layout.question_boxes:
+        x1, y1, _, _ = box.coordinates
+        centres = option_centres(box.column_ranges)
+        for row_index in range(box.total_rows):
+            question_no = box.start_question + row_index
+            centre_y = y1 + FIRST_ROW_OFFSET + row_index * ROW_PITCH
+            for option, centre_x in centres.items():
+                if marked_answers.get(question_no) == option:
+                    cv2.circle(image, (x1 + centre_x, centre_y), QUESTION_BUBBLE_RADIUS, INK_LEVEL, -1)
+                else:
+                    cv2.circle(image, (x1 + centre_x, centre_y), QUESTION_BUBBLE_RADIUS, PRINT_LEVEL, 2)
+
+    if skew_degrees:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), skew_degrees, 1.0)
+        image = cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=PAPER_LEVEL)
+    if noise > 0:
+        image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+    return image
+
+def generate_dataset(output_dir, count, fill_density=0.9, noise=0.0, skew=0.0, seed=0, layout=None):
+    #Write count synthetic sheets with their answer key CSVs and return the ground truth per image.
+    # fill_density is the chance a question is answered; each sheet is skewed by a random angle in [-skew, skew].
+    layout = layout or load_layout()
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    roll_columns = len(layout.roll_number.column_x_coordinates) - 1
+    ground_truth = {}
+    for sheet_index in range(count):
+        roll_number = "".join(
+            layout.roll_number.fixed_columns.get(column_index, str(rng.integers(0, len(layout.roll_number.row_y_coordinates))))
+            for column_index in range(roll_columns)
+        )
+        answer_key, marked_answers = {}, {}
+        for box in layout.question_boxes:
+            for row_index in range(box.total_rows):
+                question_no = box.start_question + row_index
+                answer_key[question_no] = box.options[rng.integers(len(box.options))]
+                if rng.random() < fill_density:
+                    marked_answers[question_no] = box.options[rng.integers(len(box.options))]
+        skew_degrees = float(rng.uniform(-skew, skew)) if skew else 0.0
+        image = generate_sheet(layout, roll_number, marked_answers, noise, skew_degrees, rng)
+
+        name = f"sheet_{sheet_index:05d}"
+        image_path = os.path.join(output_dir, f"{name}.png")
+        cv2.imwrite(image_path, image)
+        with open(os.path.join(output_dir, f"{name}.csv"), "w", encoding="utf-8") as csv_file:
+            csv_file.write("question_no,answer\n")
+            csv_file.writelines(f"{question_no},{answer}\n" for question_no, answer in answer_key.items())
+        ground_truth[image_path] = {
+            "roll_number": roll_number,
+            "answers": {str(question_no): answer for question_no, answer in marked_answers.items()},
+            "obtained_marks": sum(marked_answers.get(question_no) == answer for question_no, answer in answer_key.items()),
+        }
+    with open(os.path.join(output_dir, "ground_truth.json"), "w", encoding="utf-8") as truth_file:
+        json.dump(ground_truth, truth_file, indent=2)
+    return ground_truth
+
+def _peak_rss_mb():
+    #Peak resident set size of this process and of its finished children, in MB.
+    if resource is None:
+        return None, None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+def _run_mode(mode, dataset_dir, work_dir, workers, read_options, queue):
+    #Grade the dataset in one mode inside a fresh process and report timings and memory.
+    from omr_processing import process_main, process_single_file
+    from pipeline_profile import BatchProfile
+    from results_store import ResultsStore
+    results_path = os.path.join(work_dir, f"results_{mode}.sqlite")
+    profile_path = os.path.join(work_dir, f"profile_{mode}.json")
+    images = sorted(os.path.join(dataset_dir, name) for name in os.listdir(dataset_dir) if name.endswith(".png"))
+    # Silence the per-sheet progress output of this process and its pool workers
+    sys.stdout.flush()
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    started = time.perf_counter()
+    if mode == "single":
+        # What process_main does for each sheet in "single" mode, sharing one store and profile
+        profile = BatchProfile()
+        with ResultsStore(results_path) as results_store:
+            for image_path in images:
+                process_single_file(image_path, os.path.splitext(image_path)[0] + ".csv", results_store=results_store, profile=profile, headless=True, **read_options)
+        elapsed = time.perf_counter() - started
+        profile.export(profile_path)
+    else:
+        process_main(dataset_dir, None, process_mode="multiple", headless=True, workers=workers, results_path=results_path, profile_path=profile_path, **read_options)
+        elapsed = time.perf_counter() - started
+    with open(profile_path, "r", encoding="utf-8") as profile_file:
+        stages = json.load(profile_file)["stages"]
+    peak_rss, peak_worker_rss = _peak_rss_mb()
+    queue.put({
+        "mode": mode,
+        "workers": workers if mode == "multiple" else 1,
+        "sheets": len(images),
+        "elapsed_seconds": round(elapsed, 3),
+        "sheets_per_second": round(len(images) / elapsed, 2) if elapsed > 0 else None,
+        "peak_rss_mb": peak_rss,
+        "peak_worker_rss_mb": peak_worker_rss,
+        "stages_ms": {row["name"]: {key: row[key] for key in ("p50", "p95", "p99")} for row in stages},
+        "results_path": results_path,
+    })
+
+def check_accuracy(results_path, ground_truth):
+    #Compare the graded results with the ground truth; returns roll number and answer accuracy.
+    from results_store import read_results
+    sheets = read_results(results_path, "sheets")
+    answers = read_results(results_path, "answers")
+    failures = read_results(results_path, "failures")
+    # Detected answers grouped by sheet once, so each sheet is compared against its own rows only
+    detected = {}
+    for sheet_no, question_no, answer in answers[["sheet_no", "question_no", "detected_answer"]].itertuples(index=False):
+        detected.setdefault(sheet_no, {})[str(question_no)] = answer
+    roll_correct = answer_correct = answer_total = marks_correct = 0
+    for sheet in sheets.itertuples(index=False):
+        truth = ground_truth[sheet.image_path]
+        roll_correct += sheet.roll_number == truth["roll_number"]
+        marks_correct += sheet.obtained_marks == truth["obtained_marks"]
+        for question_no, answer in detected.get(sheet.sheet_no, {}).items():
+            answer_total += 1
+            answer_correct += answer == truth["answers"].get(question_no, "No answer detected")
+    graded = len(sheets)
+    return {
+        "graded": graded,
+        "failed": len(failures),
+        "roll_number_accuracy": round(roll_correct / graded, 4) if graded else None,
+        "answer_accuracy": round(answer_correct / answer_total, 4) if answer_total else None,
+        "marks_accuracy": round(marks_correct / graded, 4) if graded else None,
+    }
+
+def _wait_for_run(mode, process, queue, poll_seconds=1.0):
+    #Return the report of a _run_mode process, failing clearly if it dies before reporting.
+    while True:
+        try:
+            run = queue.get(timeout=poll_seconds)
+            break
+        except Empty:
+            if not process.is_alive():
+                # A last look, in case the report arrived just as the process exited
+                try:
+                    run = queue.get(timeout=poll_seconds)
+                    break
+                except Empty:
+                    process.join()
+                    raise RuntimeError(f"The {mode} benchmark process exited with code {process.exitcode} before reporting")
+    process.join()
+    return run
+
+def run_benchmark(count=100, fill_density=0.9, noise=0.0, skew=0.0, seed=0, workers=None, modes=("single", "multiple"), read_options=None, keep_dir=None):
+    #Generate a synthetic dataset, grade it in each process_main mode and report speed, memory and accuracy.
+    workers = workers or os.cpu_count() or 1
+    read_options = dict(read_options or {})
+    if skew and "register" not in read_options:
+        read_options["register"] = True  # Skewed scans can only be read once registered
+    work_dir = keep_dir or tempfile.mkdtemp(prefix="omr_benchmark_")
+    dataset_dir = os.path.join(work_dir, "sheets")
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    os.makedirs(work_dir, exist_ok=True)
+    for mode in modes:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(work_dir, f"results_{mode}.sqlite"))
+    print(f"Generating {count} synthetic sheets in {dataset_dir}")
+    ground_truth = generate_dataset(dataset_dir, count, fill_density, noise, skew, seed)
+
+    report = {
+        "dataset": {"count": count, "fill_density": fill_density, "noise": noise, "skew": skew, "seed": seed},
+        "read_options": read_options,
+        "runs": [],
+    }
+    context = multiprocessing.get_context("spawn")  # A clean process per mode keeps peak RSS comparable
+    try:
+        for mode in modes:
+            queue = context.Queue()
+            process = context.Process(target=_run_mode, args=(mode, dataset_dir, work_dir, workers, read_options, queue))
+            process.start()
+            run = _wait_for_run(mode, process, queue)
+            run["accuracy"] = check_accuracy(run.pop("results_path"), ground_truth)
+            report["runs"].append(run)
+            print(
+                f"{mode:<9} {run['sheets_per_second']:>8} sheets/s  peak RSS {run['peak_rss_mb']} MB"
+                f" (workers {run['peak_worker_rss_mb']} MB)  roll acc {run['accuracy']['roll_number_accuracy']}"
+                f"  answer acc {run['accuracy']['answer_accuracy']}"
+            )
+    finally:
+        if keep_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark OMR grading on synthetic sheets.")
+    parser.add_argument("--count", type=int, default=100, help="Number of sheets to generate")
+    parser.add_argument("--fill-density", type=float, default=0.9, help="Chance that a question is answered")
+    parser.add_argument("--noise", type=float, default=0.0, help="Gaussian noise standard deviation in grey levels")
+    parser.add_argument("--skew", type=float, default=0.0, help="Maximum skew angle in degrees")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="Grading processes for the folder mode (default: all cores)")
+    parser.add_argument("--modes", nargs="+", choices=["single", "multiple"], default=["single", "multiple"])
+    parser.add_argument("--single-pass", action="store_true", help="Use the single-pass contour pipeline")
+    parser.add_argument("--auto-threshold", action="store_true", help="Use automatic thresholds")
+    parser.add_argument("--keep-dir", help="Keep the generated sheets, results and profiles in this folder")
+    parser.add_argument("--output", help="Save the report as JSON")
+    parser.add_argument("--min-accuracy", type=float, default=1.0, help="Fail when answer or roll accuracy drops below this")
+    parser.add_argument("--render-sheet", help="Write a blank sheet drawn from --layout to this PNG and exit")
+    parser.add_argument("--layout", help="Layout JSON for --render-sheet (default: the 30-question sheet)")
+    args = parser.parse_args(argv)
+
+    if args.render_sheet:
+        # Blank bubbles and frame at the layout's coordinates, for checking a layout or printing test sheets
+        cv2.imwrite(args.render_sheet, generate_sheet(load_layout(args.layout), "", {}))
+        print(f"Blank sheet for {args.layout or 'the default layout'} written to {args.render_sheet}")
+        return 0
+
+    read_options = {"single_pass": args.single_pass, "threshold_mode": "auto" if args.auto_threshold else "fixed"}
+    try:
+        report = run_benchmark(args.count, args.fill_density, args.noise, args.skew, args.seed, args.workers, args.modes, read_options, args.keep_dir)
+    except RuntimeError as error:
+        print(f"Benchmark failed: {error}")
+        return 1
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Benchmark report saved to {args.output}")
+    for run in report["runs"]:
+        accuracy = run["accuracy"]
+        if accuracy["failed"] or min(accuracy["roll_number_accuracy"] or 0, accuracy["answer_accuracy"] or 0) < args.min_accuracy:
+            print(f"Accuracy check failed for {run['mode']} mode: {accuracy}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
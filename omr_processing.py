@@ -1,38 +1,118 @@
 import cv2
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+from collections import deque
 import os
+import shutil
+import time
+from sheet_layout import compile_option_lookup, compile_roll_lookups, load_layout, lookup_index
+from sheet_registration import estimate_registration, warp_regions
+from results_store import DEFAULT_RESULTS_PATH, ResultsStore
+from pipeline_profile import BatchProfile
+import pipeline_profile
+
+# Sheet decoding
+class OMRSheet:
+    #Decode an OMR sheet once and hand out views of the grayscale buffer for each region.
+    # image_path may also be an already decoded image, such as an upload decoded in memory.
+    def __init__(self, image_path):
+        if isinstance(image_path, np.ndarray):
+            self.image_path = "uploaded_sheet"
+            self.image = image_path if image_path.ndim == 2 else cv2.cvtColor(image_path, cv2.COLOR_BGR2GRAY)
+        else:
+            self.image_path = image_path
+            self.image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if self.image is None:
+            raise ValueError(f"Unable to read OMR sheet image: {image_path}")
+        self._thresholded = {}  # Whole-sheet binary images keyed by threshold value
+        self.registration_matrix = None  # Affine transform applied by register(), if any
+
+    def register(self, registration, regions):
+        #Align a skewed scan to the layout's reference frame, warping only the regions that will be read.
+        # Well-aligned scans are left untouched, so the cost is one downsampled contour pass.
+        matrix = estimate_registration(self.image, registration)
+        if matrix is not None:
+            self.image = warp_regions(self.image, matrix, regions)
+            self._thresholded = {}
+            self.registration_matrix = matrix
+        return matrix
+
+    def crop(self, coordinates):
+        #Return a zero-copy view of the region (x1, y1, x2, y2) of the grayscale sheet.
+        x1, y1, x2, y2 = coordinates
+        return self.image[y1:y2, x1:x2]
+
+    def threshold(self, coordinates, threshold_value):
+        #Return a zero-copy view of the region in the sheet thresholded once per threshold value.
+        if threshold_value not in self._thresholded:
+            _, self._thresholded[threshold_value] = cv2.threshold(self.image, threshold_value, 255, cv2.THRESH_BINARY_INV)
+        x1, y1, x2, y2 = coordinates
+        return self._thresholded[threshold_value][y1:y2, x1:x2]
+
+def load_sheet(image_path_or_sheet):
+    #Return an OMRSheet, decoding the image only if a path is given.
+    if isinstance(image_path_or_sheet, OMRSheet):
+        return image_path_or_sheet
+    return OMRSheet(image_path_or_sheet)
+
+# Automatic thresholds
+def auto_threshold(region, calibrated_threshold, stride=4, ink_percentile=0.5, paper_percentile=50, min_contrast=32):
+    #Rescale a calibrated threshold to the ink and paper levels measured on a subsampled histogram of the region.
+    # The layout thresholds were tuned for black ink on white paper (0 and 255); dark paper or faint pencil
+    # shift both levels, so the threshold keeps the same relative position between them.
+    histogram = np.bincount(region[::stride, ::stride].ravel(), minlength=256)
+    cumulative = np.cumsum(histogram) / max(histogram.sum(), 1)
+    ink_level = int(np.searchsorted(cumulative, ink_percentile / 100))
+    paper_level = int(np.searchsorted(cumulative, paper_percentile / 100))
+    if paper_level - ink_level < min_contrast:
+        return calibrated_threshold  # Blank or unreadable region: keep the calibrated value
+    return int(round(ink_level + (paper_level - ink_level) * calibrated_threshold / 255))
+
+def union_coordinates(regions):
+    #Return the bounding box (x1, y1, x2, y2) covering every region.
+    return (
+        min(region.coordinates[0] for region in regions),
+        min(region.coordinates[1] for region in regions),
+        max(region.coordinates[2] for region in regions),
+        max(region.coordinates[3] for region in regions),
+    )
+
+def format_thresholds(thresholds):
+    #Format the threshold used for each region for the results, e.g. "roll_number=110;questions_1=127".
+    return ";".join(f"{region_name}={threshold_value}" for region_name, threshold_value in thresholds.items())
 
 # Setup image and thresholding
-def setup_image_and_threshold_basic(image_path, green_box_coordinates):
-    #Load the image, crop the green box, and apply basic thresholding.
-    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    show_image("Grayscale Image", image)
-    x1, y1, x2, y2 = green_box_coordinates
-    green_box_image = image[y1:y2, x1:x2]
-    show_image("Cropped Green Box", green_box_image)
-    _, thresholded_green_box = cv2.threshold(green_box_image, 110, 255, cv2.THRESH_BINARY_INV)
-    show_image("Thresholded Image", thresholded_green_box)
+def setup_image_and_threshold_basic(image_path_or_sheet, green_box_coordinates, visualize=True, threshold_value=110):
+    #Crop the green box from the decoded sheet and apply basic thresholding.
+    sheet = load_sheet(image_path_or_sheet)
+    green_box_image = sheet.crop(green_box_coordinates)
+    thresholded_green_box = sheet.threshold(green_box_coordinates, threshold_value)
+    if visualize:
+        show_image("Grayscale Image", sheet.image)
+        show_image("Cropped Green Box", green_box_image)
+        show_image("Thresholded Image", thresholded_green_box)
     return green_box_image, thresholded_green_box
 
-def setup_image_and_threshold_advanced(image_path, green_box_coordinates):
-    #Load the image, crop the green box, and apply advanced thresholding.
-    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    show_image("Grayscale Image", image)
-    x1, y1, x2, y2 = green_box_coordinates
-    green_box_image = image[y1:y2, x1:x2]
-    show_image("Cropped Green Box", green_box_image)
-    _, thresholded_green_box = cv2.threshold(green_box_image, 127, 255, cv2.THRESH_BINARY_INV)
-    show_image("Thresholded Image", thresholded_green_box)
+def setup_image_and_threshold_advanced(image_path_or_sheet, green_box_coordinates, visualize=True, threshold_value=127):
+    #Crop the green box from the decoded sheet and apply advanced thresholding.
+    sheet = load_sheet(image_path_or_sheet)
+    green_box_image = sheet.crop(green_box_coordinates)
+    thresholded_green_box = sheet.threshold(green_box_coordinates, threshold_value)
+    if visualize:
+        show_image("Grayscale Image", sheet.image)
+        show_image("Cropped Green Box", green_box_image)
+        show_image("Thresholded Image", thresholded_green_box)
     return green_box_image, thresholded_green_box
 
 # Detect filled circles
-def detect_filled_circles_basic(thresholded_image, min_area=35, max_area=100, min_radius=0.5, max_radius=10):
+def detect_filled_circles_basic(thresholded_image, min_area=35, max_area=100, min_radius=0.5, max_radius=10, visualize=True):
     #Detect filled circles using basic parameters.
     contours, _ = cv2.findContours(thresholded_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    show_image("Contours Detected", cv2.cvtColor(cv2.cvtColor(thresholded_image, cv2.COLOR_GRAY2BGR), cv2.COLOR_BGR2RGB), cmap=None)
+    if visualize:
+        show_image("Contours Detected", cv2.cvtColor(cv2.cvtColor(thresholded_image, cv2.COLOR_GRAY2BGR), cv2.COLOR_BGR2RGB), cmap=None)
     filled_circles = []
     for contour in contours:
         area = cv2.contourArea(contour)
@@ -40,14 +120,17 @@ def detect_filled_circles_basic(thresholded_image, min_area=35, max_area=100, mi
             ((x, y), radius) = cv2.minEnclosingCircle(contour)
             if min_radius < radius < max_radius:
                 filled_circles.append((int(x), int(y), int(radius)))
+    pipeline_profile.count("contours_found", len(contours))
+    pipeline_profile.count("circles_kept", len(filled_circles))
     return filled_circles
 
-def detect_filled_circles_advanced(thresholded_image, min_area=20, max_area=800, min_radius=3, max_radius=20):
+def detect_filled_circles_advanced(thresholded_image, min_area=20, max_area=800, min_radius=3, max_radius=20, visualize=True):
     #Detect filled circles using advanced parameters.
     contours, _ = cv2.findContours(thresholded_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    contour_debug_image = cv2.cvtColor(thresholded_image, cv2.COLOR_GRAY2BGR)
-    cv2.drawContours(contour_debug_image, contours, -1, (0, 255, 0), 1)
-    show_image("Contours Detected", cv2.cvtColor(contour_debug_image, cv2.COLOR_BGR2RGB), cmap=None)
+    if visualize:
+        contour_debug_image = cv2.cvtColor(thresholded_image, cv2.COLOR_GRAY2BGR)
+        cv2.drawContours(contour_debug_image, contours, -1, (0, 255, 0), 1)
+        show_image("Contours Detected", cv2.cvtColor(contour_debug_image, cv2.COLOR_BGR2RGB), cmap=None)
     filled_circles = []
     for contour in contours:
         area = cv2.contourArea(contour)
@@ -55,9 +138,11 @@ def detect_filled_circles_advanced(thresholded_image, min_area=20, max_area=800,
             ((x, y), radius) = cv2.minEnclosingCircle(contour)
             if min_radius < radius < max_radius:
                 filled_circles.append((int(x), int(y), int(radius)))
+    pipeline_profile.count("contours_found", len(contours))
+    pipeline_profile.count("circles_kept", len(filled_circles))
     return filled_circles
 
-def highlight_circles_and_grid(image, circles, column_x_coordinates, row_y_coordinates, row_labels, color=(0, 255, 0),line_thickness=1, circle_color=(0, 0, 255), circle_thickness=2):
+def highlight_circles_and_grid(image, circles, column_x_coordinates, row_y_coordinates, row_labels, color=(0, 255, 0),line_thickness=1, circle_color=(0, 0, 255), circle_thickness=2, visualize=True):
     #Highlight circles and overlay grid on the image.
     image_with_grid = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
     for x in column_x_coordinates:
@@ -68,49 +153,89 @@ def highlight_circles_and_grid(image, circles, column_x_coordinates, row_y_coord
         cv2.circle(image_with_grid, (x, y), r, circle_color, circle_thickness)
     for row_y, label in zip(row_y_coordinates, row_labels):
         cv2.putText(image_with_grid, str(label), (10, row_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1, cv2.LINE_AA)
-    show_image("Grid with Circles Highlighted", cv2.cvtColor(image_with_grid, cv2.COLOR_BGR2RGB), cmap=None)
+    if visualize:
+        show_image("Grid with Circles Highlighted", cv2.cvtColor(image_with_grid, cv2.COLOR_BGR2RGB), cmap=None)
     return image_with_grid
 
+# Bubble assignment
+def assign_bubbles(all_circles, black_circles, total_rows=10, option_lookup=None):
+    #Bin every circle into rows and option columns in one vectorized pass.
+    # Rows split the span of circle centres into total_rows equal bands with inclusive integer bounds,
+    # so a circle sitting exactly on a shared bound belongs to both bands (first_row..last_row).
+    # Returns a dict of equal-length columns: x, y, radius, filled, first_row, last_row and option.
+    circles = np.asarray(all_circles, dtype=np.int64).reshape(-1, 3)
+    black_set = set(map(tuple, black_circles))
+    bubbles = {
+        "x": circles[:, 0],
+        "y": circles[:, 1],
+        "radius": circles[:, 2],
+        "filled": np.fromiter((tuple(circle) in black_set for circle in all_circles), dtype=bool, count=len(circles)),
+    }
+    if len(circles) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        bubbles.update(first_row=empty, last_row=empty, option=empty)
+        return bubbles
+
+    y = bubbles["y"]
+    top = y.min()
+    row_height = (y.max() - top) / total_rows
+    row_starts = (top + np.arange(total_rows) * row_height).astype(np.int64)
+    row_ends = (top + np.arange(1, total_rows + 1) * row_height).astype(np.int64)
+    bubbles["first_row"] = np.searchsorted(row_ends, y, side="left")
+    bubbles["last_row"] = np.searchsorted(row_starts, y, side="right") - 1
+
+    if option_lookup is None:
+        bubbles["option"] = np.full(len(circles), -1, dtype=np.int64)
+    else:
+        x = bubbles["x"]
+        inside = (x >= 0) & (x < len(option_lookup))
+        bubbles["option"] = np.where(inside, option_lookup[np.clip(x, 0, len(option_lookup) - 1)], -1)
+    return bubbles
+
+def expand_bubble_rows(bubbles, mask):
+    #Return (bubble index, row) pairs for the selected bubbles, one pair per row each bubble belongs to.
+    indices = np.flatnonzero(mask)
+    row_counts = np.clip(bubbles["last_row"][indices] - bubbles["first_row"][indices] + 1, 0, None)
+    repeated = np.repeat(indices, row_counts)
+    offsets = np.arange(len(repeated)) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    return repeated, bubbles["first_row"][repeated] + offsets
+
 # Highlight circles for MCQs
-def highlight_mcq_circles(image, black_circles, all_circles, column_ranges, total_rows=10, color=(0, 255, 0),thickness=2):
+def highlight_mcq_circles(image, black_circles, all_circles, column_ranges, total_rows=10, color=(0, 255, 0),thickness=2, visualize=True):
     # Convert the grayscale image to BGR for visualization
     image_with_highlight = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
 
-    # Sort circles by their y-coordinates
-    all_circles_sorted = sorted(all_circles, key=lambda x: x[1])
-    row_height = (all_circles_sorted[-1][1] - all_circles_sorted[0][1]) / total_rows
-
-    # Define row boundaries
-    row_boundaries = [
-        (int(all_circles_sorted[0][1] + i * row_height), int(all_circles_sorted[0][1] + (i + 1) * row_height))
-        for i in range(total_rows)
-    ]
+    # Highlight the filled circles that fall inside a row
+    bubbles = assign_bubbles(all_circles, black_circles, total_rows)
+    in_rows = bubbles["filled"] & (bubbles["first_row"] <= bubbles["last_row"])
+    for x, y, radius in zip(bubbles["x"][in_rows].tolist(), bubbles["y"][in_rows].tolist(), bubbles["radius"][in_rows].tolist()):
+        cv2.circle(image_with_highlight, (x, y), radius, color, thickness)
 
-    # Highlight circles
-    for y_start, y_end in row_boundaries:
-        for circle in black_circles:
-            if y_start <= circle[1] <= y_end:
-                cv2.circle(image_with_highlight, (circle[0], circle[1]), circle[2], color, thickness)
-
-    show_image("MCQ Circles Highlighted", cv2.cvtColor(image_with_highlight, cv2.COLOR_BGR2RGB))
+    if visualize:
+        show_image("MCQ Circles Highlighted", cv2.cvtColor(image_with_highlight, cv2.COLOR_BGR2RGB))
     return image_with_highlight
 
-def analyze_all_columns_with_visualization(image, black_filled_circles, column_x_coordinates, row_y_coordinates, row_labels):
+def analyze_all_columns_with_visualization(image, black_filled_circles, column_x_coordinates, row_y_coordinates, row_labels, visualize=True, column_lookup=None, row_lookup=None, fixed_columns=None):
+    #Read the roll number digits, classifying each filled circle through the x -> column and y -> row lookups.
+    if column_lookup is None or row_lookup is None:
+        column_lookup, row_lookup = compile_roll_lookups(column_x_coordinates, row_y_coordinates, image.shape[1], image.shape[0])
+    if fixed_columns is None:
+        fixed_columns = {2: "P"}
+    detected_rows = {}
+    for x, y, _ in black_filled_circles:
+        col_index = lookup_index(column_lookup, x)
+        row_index = lookup_index(row_lookup, y)
+        if col_index >= 0 and row_index >= 0:
+            detected_rows[col_index] = row_index  # The last circle in a column wins
     roll_number = []
     for col_index in range(len(column_x_coordinates) - 1):
-        column_start = column_x_coordinates[col_index]
-        column_end = column_x_coordinates[col_index + 1]
-        if col_index == 2:
-            roll_number.append("P")
-            continue
-        detected_row = None
-        column_circles = [circle for circle in black_filled_circles if column_start <= circle[0] < column_end]
-        for _, y, _ in column_circles:
-            for row_index, row_y in enumerate(row_y_coordinates):
-                if abs(y - row_y) <= (row_y_coordinates[1] - row_y_coordinates[0]) // 2:
-                    detected_row = row_index
-                    break
-        roll_number.append(str(detected_row) if detected_row is not None else '0')
+        if col_index in fixed_columns:
+            roll_number.append(fixed_columns[col_index])
+        else:
+            roll_number.append(str(detected_rows.get(col_index, 0)))
+    if not visualize:
+        # Headless mode skips the BGR conversion and overlay drawing entirely
+        return roll_number, None
     visualization_image = highlight_circles_and_grid(
         image, black_filled_circles, column_x_coordinates, row_y_coordinates, row_labels,
         color=(0, 255, 0), line_thickness=1, circle_color=(0, 0, 255), circle_thickness=2
@@ -120,6 +245,7 @@ def analyze_all_columns_with_visualization(image, black_filled_circles, column_x
 # Utility functions for image display
 def show_image(title, image, cmap='gray'):
     #Utility function to display an image with a specific title.
+    import matplotlib.pyplot as plt  # Imported lazily so headless runs never load matplotlib
     plt.figure(figsize=(10, 10))
     plt.title(title)
     if cmap == 'gray':
@@ -130,24 +256,25 @@ def show_image(title, image, cmap='gray'):
     plt.show()
 
 # Setup image and thresholding
-def setup_image_and_threshold(image_path, green_box_coordinates):
-    #Load the image, crop the green box, and apply thresholding.
-    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    show_image("Original OMR Sheet", image)
-    x1, y1, x2, y2 = green_box_coordinates
-    green_box_image = image[y1:y2, x1:x2]
-    show_image("Cropped Green Box", green_box_image)
-    _, thresholded_green_box = cv2.threshold(green_box_image, 127, 255, cv2.THRESH_BINARY_INV)
-    show_image("Thresholded Green Box (Binary Image)", thresholded_green_box)
+def setup_image_and_threshold(image_path_or_sheet, green_box_coordinates, visualize=True, threshold_value=127):
+    #Crop the green box from the decoded sheet and apply thresholding.
+    sheet = load_sheet(image_path_or_sheet)
+    green_box_image = sheet.crop(green_box_coordinates)
+    thresholded_green_box = sheet.threshold(green_box_coordinates, threshold_value)
+    if visualize:
+        show_image("Original OMR Sheet", sheet.image)
+        show_image("Cropped Green Box", green_box_image)
+        show_image("Thresholded Green Box (Binary Image)", thresholded_green_box)
     return green_box_image, thresholded_green_box
 
 # Detect filled circles
-def detect_filled_circles(thresholded_image, min_area=20, max_area=800, min_radius=3, max_radius=20):
+def detect_filled_circles(thresholded_image, min_area=20, max_area=800, min_radius=3, max_radius=20, visualize=True):
     #Detect circles from contours in the thresholded image.
     contours, _ = cv2.findContours(thresholded_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    contour_debug_image = cv2.cvtColor(thresholded_image, cv2.COLOR_GRAY2BGR)
-    cv2.drawContours(contour_debug_image, contours, -1, (0, 255, 0), 1)
-    show_image("Contours Detected", cv2.cvtColor(contour_debug_image, cv2.COLOR_BGR2RGB), cmap=None)
+    if visualize:
+        contour_debug_image = cv2.cvtColor(thresholded_image, cv2.COLOR_GRAY2BGR)
+        cv2.drawContours(contour_debug_image, contours, -1, (0, 255, 0), 1)
+        show_image("Contours Detected", cv2.cvtColor(contour_debug_image, cv2.COLOR_BGR2RGB), cmap=None)
     filled_circles = []
     for contour in contours:
         area = cv2.contourArea(contour)
@@ -155,328 +282,709 @@ def detect_filled_circles(thresholded_image, min_area=20, max_area=800, min_radi
             ((x, y), radius) = cv2.minEnclosingCircle(contour)
             if min_radius < radius < max_radius:
                 filled_circles.append((int(x), int(y), int(radius)))
+    pipeline_profile.count("contours_found", len(contours))
+    pipeline_profile.count("circles_kept", len(filled_circles))
     return filled_circles
 
+def detect_circles_single_pass(sheet, regions, thresholds=None):
+    #Detect circles for several regions with one threshold and one contour pass per threshold value.
+    # The union bounding box of the regions sharing a threshold is thresholded once, contours are extracted
+    # once, and each circle is routed to the region holding its centre, in that region's coordinates.
+    # Each region needs coordinates, threshold and detection (contour area/radius limits) attributes;
+    # thresholds, if given, overrides the per-region threshold values.
+    if thresholds is None:
+        thresholds = [region.threshold for region in regions]
+    region_circles = [[] for _ in regions]
+    for threshold_value in sorted(set(thresholds)):
+        group = [(index, region) for index, region in enumerate(regions) if thresholds[index] == threshold_value]
+        union_x1, union_y1, union_x2, union_y2 = union_coordinates([region for _, region in group])
+        thresholded_union = sheet.threshold((union_x1, union_y1, union_x2, union_y2), threshold_value)
+        contours, _ = cv2.findContours(thresholded_union, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        pipeline_profile.count("contours_found", len(contours))
+        # Noise contours are dropped on area alone, against the loosest limits of the group, before the
+        # enclosing circle is fitted; the survivors are checked against their own region's limits
+        group_min_area = min(region.detection["min_area"] for _, region in group)
+        group_max_area = max(region.detection["max_area"] for _, region in group)
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if not group_min_area < area < group_max_area:
+                continue
+            ((x, y), radius) = cv2.minEnclosingCircle(contour)
+            centre_x, centre_y = int(x) + union_x1, int(y) + union_y1
+            for index, region in group:
+                x1, y1, x2, y2 = region.coordinates
+                if x1 <= centre_x < x2 and y1 <= centre_y < y2:
+                    detection = region.detection
+                    if detection["min_area"] < area < detection["max_area"] and detection["min_radius"] < radius < detection["max_radius"]:
+                        region_circles[index].append((centre_x - x1, centre_y - y1, int(radius)))
+                    break
+    pipeline_profile.count("circles_kept", sum(len(circles) for circles in region_circles))
+    return region_circles
+
+# Disk stencils keyed by radius, shared by every sheet in the process
+_disk_stencil_cache = {}
+
+def disk_stencil_offsets(radius):
+    #Return the (dy, dx) offsets of the pixels cv2.circle fills for a radius, rendered once per radius.
+    if radius not in _disk_stencil_cache:
+        size = 2 * radius + 1
+        stencil = cv2.circle(np.zeros((size, size), dtype=np.uint8), (radius, radius), radius, 255, -1)
+        dy, dx = np.nonzero(stencil)
+        _disk_stencil_cache[radius] = (dy - radius, dx - radius)
+    return _disk_stencil_cache[radius]
+
+def circle_fill_ratios(thresholded_image, circles):
+    #Compute the fraction of foreground pixels inside every circle, one vectorized gather per distinct radius.
+    ratios = np.zeros(len(circles))
+    if not circles:
+        return ratios
+    circles_array = np.asarray(circles, dtype=np.intp)
+    height, width = thresholded_image.shape[:2]
+    for radius in np.unique(circles_array[:, 2]):
+        indices = np.flatnonzero(circles_array[:, 2] == radius)
+        dy, dx = disk_stencil_offsets(int(radius))
+        ys = circles_array[indices, 1, None] + dy
+        xs = circles_array[indices, 0, None] + dx
+        # Stencil pixels outside the region are dropped, as when drawing the circle on a full-size mask
+        inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+        foreground = thresholded_image[np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1)] > 0
+        total_pixels = inside.sum(axis=1)
+        black_pixels = (foreground & inside).sum(axis=1)
+        ratios[indices] = np.divide(black_pixels, total_pixels, out=np.zeros(len(indices)), where=total_pixels > 0)
+    return ratios
+
 # Count black-filled circles
 def count_black_filled_circles(thresholded_image, filled_circles, black_pixel_ratio_threshold=0.7):
-    black_filled_count = 0
-    corrected_filled_circles = []
-    for (x, y, r) in filled_circles:
-        mask = cv2.circle(np.zeros_like(thresholded_image, dtype=np.uint8), (x, y), r, 255, -1)
-        circle_pixels = cv2.bitwise_and(thresholded_image, mask)
-        total_pixels = np.sum(mask > 0)
-        black_pixels = np.sum(circle_pixels > 0)
-        if black_pixels / total_pixels > black_pixel_ratio_threshold:
-            black_filled_count += 1
-            corrected_filled_circles.append((x, y, r))
-    return black_filled_count, corrected_filled_circles
+    #Count the circles whose black pixel ratio exceeds the threshold, scoring all circles in one batch.
+    ratios = circle_fill_ratios(thresholded_image, filled_circles)
+    corrected_filled_circles = [circle for circle, ratio in zip(filled_circles, ratios) if ratio > black_pixel_ratio_threshold]
+    pipeline_profile.count("filled_circles", len(corrected_filled_circles))
+    return len(corrected_filled_circles), corrected_filled_circles
 
 # Highlight filled and unfilled circles
-def highlight_filled_and_unfilled_circles(image, all_circles, filled_circles, filled_color=(0, 255, 0),unfilled_color=(0, 0, 255), thickness=2):
+def highlight_filled_and_unfilled_circles(image, all_circles, filled_circles, filled_color=(0, 255, 0),unfilled_color=(0, 0, 255), thickness=2, visualize=True):
     #Highlight filled and unfilled circles on the image.
     image_with_circles = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    filled_set = set(map(tuple, filled_circles))
     for circle in all_circles:
-        if circle in filled_circles:
+        if tuple(circle) in filled_set:
             cv2.circle(image_with_circles, (circle[0], circle[1]), circle[2], filled_color, thickness)
         else:
             cv2.circle(image_with_circles, (circle[0], circle[1]), circle[2], unfilled_color, thickness)
-    show_image("Circles Highlighted", cv2.cvtColor(image_with_circles, cv2.COLOR_BGR2RGB), cmap=None)
+    if visualize:
+        show_image("Circles Highlighted", cv2.cvtColor(image_with_circles, cv2.COLOR_BGR2RGB), cmap=None)
     return image_with_circles
 
 # Analyze rows
-def analyze_all_rows(image, black_circles, all_circles, total_rows=10, column_ranges=None, start_question=1):
-    #nalyze all rows and determine the selected option for each question.
+def analyze_all_rows(image, black_circles, all_circles, total_rows=10, column_ranges=None, start_question=1, option_lookup=None):
+    #Analyze all rows and determine the selected option for each question.
     if column_ranges is None:
         raise ValueError("Column ranges must be provided for analysis.")
-    all_circles_sorted = sorted(all_circles, key=lambda x: x[1])
-    row_height = (all_circles_sorted[-1][1] - all_circles_sorted[0][1]) / total_rows
-    row_boundaries = [
-        (int(all_circles_sorted[0][1] + i * row_height), int(all_circles_sorted[0][1] + (i + 1) * row_height))
-        for i in range(total_rows)
-    ]
-    results = {}
-    question_number = start_question
-    for y_start, y_end in row_boundaries:
-        row_circles = [circle for circle in all_circles if y_start <= circle[1] <= y_end]
-        black_circles_in_row = [circle for circle in row_circles if circle in black_circles]
-        row_answer = "No answer detected"
-        for circle in black_circles_in_row:
-            for option, (start, end) in column_ranges.items():
-                if start <= circle[0] <= end:
-                    row_answer = option
-                    break
-        results[question_number] = row_answer
-        question_number += 1
+    options = list(column_ranges)
+    if option_lookup is None:
+        option_lookup = compile_option_lookup(column_ranges, image.shape[1])
+    bubbles = assign_bubbles(all_circles, black_circles, total_rows, option_lookup)
 
+    # For each row keep the last filled circle (in detection order) that falls in an option column
+    bubble_indices, rows = expand_bubble_rows(bubbles, bubbles["filled"] & (bubbles["option"] >= 0))
+    last_bubble = np.full(total_rows, -1, dtype=np.int64)
+    np.maximum.at(last_bubble, rows, bubble_indices)
+
+    results = {}
+    for row_index, bubble_index in enumerate(last_bubble.tolist()):
+        if bubble_index >= 0:
+            results[start_question + row_index] = options[bubbles["option"][bubble_index]]
+        else:
+            results[start_question + row_index] = "No answer detected"
     return results
 
-# Check answers and store results
-def check_answers_and_store_results(omr_results, correct_answers_csv):
-    #Check detected answers against the correct ones and save the detailed results.
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_csv = f"results_{timestamp}.csv"  # Generate unique filename using timestamp
-    correct_answers_df = pd.read_csv(correct_answers_csv)
-    correct_answers = dict(zip(correct_answers_df['question_no'], correct_answers_df['answer']))
-    total_marks = len(correct_answers)
-    obtained_marks = 0
-    results = []
-    for question_no, correct_answer in correct_answers.items():
-        detected_answer = omr_results.get(question_no, "No answer detected")
-        is_correct = detected_answer == correct_answer
-        obtained_marks += 1 if is_correct else 0
-        results.append({
-            "question_no": question_no,
-            "correct_answer": correct_answer,
-            "detected_answer": detected_answer,
-            "is_correct": "Yes" if is_correct else "No"
+# Answer keys
+class AnswerKey:
+    #Answer key parsed once into arrays of question numbers and answer codes, so grading is one vectorized comparison.
+    def __init__(self, correct_answers):
+        self.correct_answers = correct_answers
+        self.question_numbers = np.array(list(correct_answers.keys()))
+        self.answer_labels = {}  # Answer text -> code, shared by the key and the detected answers
+        codes = []
+        for answer in correct_answers.values():
+            if pd.isna(answer):
+                codes.append(-2)  # A missing key entry never matches anything
+            else:
+                codes.append(self.answer_labels.setdefault(answer, len(self.answer_labels)))
+        self.answer_codes = np.array(codes, dtype=np.int32)
+
+    @classmethod
+    def from_csv(cls, answers_csv_path):
+        #Parse an answer key CSV with question_no and answer columns.
+        correct_answers_df = pd.read_csv(answers_csv_path)
+        return cls(dict(zip(correct_answers_df['question_no'], correct_answers_df['answer'])))
+
+    @property
+    def total_marks(self):
+        return len(self.answer_codes)
+
+    def detected_answers(self, omr_results):
+        #Return the detected answer for every key question, in key order.
+        return [omr_results.get(question_no, "No answer detected") for question_no in self.question_numbers.tolist()]
+
+    def grade(self, omr_results):
+        #Return a boolean array marking which key questions were answered correctly.
+        detected_codes = np.array([self.answer_labels.get(answer, -1) for answer in self.detected_answers(omr_results)], dtype=np.int32)
+        return detected_codes == self.answer_codes
+
+class VariantAnswerKeys:
+    #Answer keys of shuffled exam variants, parsed from one CSV with variant, question_no and answer columns.
+    def __init__(self, keys):
+        self.keys = keys  # Variant ID (int) -> AnswerKey
+
+    @classmethod
+    def from_frame(cls, answers_df):
+        return cls({
+            int(variant): AnswerKey(dict(zip(variant_df['question_no'], variant_df['answer'])))
+            for variant, variant_df in answers_df.groupby('variant', sort=True)
         })
-    results.append({
-        "question_no": "Total",
-        "correct_answer": total_marks,
-        "detected_answer": obtained_marks,
-        "is_correct": ""
-    })
-    results_df = pd.DataFrame(results)
-    results_df.to_csv(output_csv, index=False)
-    print(f"Results saved to {output_csv}")
-
-# Function to store summary results
-def store_summary_results(roll_number, total_marks, obtained_marks):
-    #Store the summary results including roll number, total marks, and obtained marks in a unique CSV file.
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_summary_csv = f"summary_results_{timestamp}.csv"  # Generate unique filename using timestamp
-    summary_data = {
-        "Roll Number": [roll_number],
-        "Total Marks": [total_marks],
-        "Obtained Marks": [obtained_marks]
-    }
-    summary_df = pd.DataFrame(summary_data)
-    summary_df.to_csv(output_summary_csv, index=False)
-    print(f"Summary results saved to {output_summary_csv}")
 
-def process_single_file(image_path, answers_csv_path):
-    #Process a single image and corresponding answer CSV file.
-    # Code logic remains the same for single file processing
-    print(f"Processing single file: {image_path}")
-
-    # Parameters for Code 1
-    green_box_coordinates = (670, 250, 1000, 490)
-    column_x_coordinates_code1 = [40, 80, 120, 160, 200, 240, 280, 320]
-    row_y_coordinates_code1 = [50, 70, 90, 110, 130, 150, 170, 190, 207, 230]
-    row_labels_code1 = list(range(len(row_y_coordinates_code1)))
+    def for_variant(self, variant):
+        #Return the answer key of the variant read from a sheet.
+        if variant is None or not str(variant).isdigit():
+            raise ValueError("No exam variant was read from the sheet, so the answer key cannot be chosen")
+        if int(variant) not in self.keys:
+            raise ValueError(f"No answer key for variant {variant}")
+        return self.keys[int(variant)]
 
-    # Code 1 Execution
-    print("Executing Code 1...")
-    green_box_image, thresholded_green_box = setup_image_and_threshold_basic(image_path, green_box_coordinates)
-    detected_circles = detect_filled_circles_basic(thresholded_green_box)
-    _, black_filled_circles = count_black_filled_circles(thresholded_green_box, detected_circles)
-    roll_number, visualization_image = analyze_all_columns_with_visualization(green_box_image, black_filled_circles, column_x_coordinates_code1, row_y_coordinates_code1, row_labels_code1)
-    plt.imshow(cv2.cvtColor(visualization_image, cv2.COLOR_BGR2RGB))
-    plt.title("Gridlines with Highlighted Circles and Row Labels (Code 1)")
-    plt.show()
-    roll_number_str = ''.join(roll_number)
-    print(f"Detected Roll Number (Code 1): {roll_number_str}")
-
-    # Parameters for Code 2
-    green_boxes_code2 = [
-        {
-            "coordinates": (0, 580, 860, 900),
-            "column_ranges": {
-                "A": (0, 750),
-                "B": (751, 790),
-                "C": (791, 820),
-                "D": (821, 850)
-            },
-            "start_question": 1
-        },
-        {
-            "coordinates": (860, 580, 1035, 1100),
-            "column_ranges": {
-                "A": (0, 60),
-                "B": (61, 90),
-                "C": (91, 130),
-                "D": (131, 160)
-            },
-            "start_question": 11
-        },
+def read_answer_key(answers_csv_path):
+    #Parse an answer key CSV: one AnswerKey, or VariantAnswerKeys when the CSV has a variant column.
+    correct_answers_df = pd.read_csv(answers_csv_path)
+    if 'variant' in correct_answers_df.columns:
+        return VariantAnswerKeys.from_frame(correct_answers_df)
+    return AnswerKey(dict(zip(correct_answers_df['question_no'], correct_answers_df['answer'])))
+
+# Parsed answer keys keyed by path, reused while the file's mtime and size are unchanged
+_answer_key_cache = {}
+
+def load_answer_key(answers_csv_path):
+    #Return the parsed answer key for a CSV, parsing the file only when it is new or has changed.
+    cache_key = os.path.abspath(answers_csv_path)
+    file_stat = os.stat(cache_key)
+    signature = (file_stat.st_mtime_ns, file_stat.st_size)
+    cached = _answer_key_cache.get(cache_key)
+    if cached is None or cached[0] != signature:
+        cached = (signature, read_answer_key(cache_key))
+        _answer_key_cache[cache_key] = cached
+    return cached[1]
+
+# Check answers
+def grade_answers(omr_results, correct_answers_csv, variant=None):
+    #Check detected answers against the correct ones, returning the per-question rows, total and obtained marks.
+    # With a variant answer key CSV, the key of the sheet's variant is used.
+    with pipeline_profile.stage("answer_key"):
+        answer_key = load_answer_key(correct_answers_csv)
+        if isinstance(answer_key, VariantAnswerKeys):
+            answer_key = answer_key.for_variant(variant)
+    with pipeline_profile.stage("grading"):
+        is_correct_flags = answer_key.grade(omr_results)
+    answer_rows = [
         {
-            "coordinates": (1035, 580, 1600, 1100),
-            "column_ranges": {
-                "A": (0, 60),
-                "B": (61, 100),
-                "C": (101, 140),
-                "D": (141, 180)
-            },
-            "start_question": 21
+            "question_no": question_no,
+            "correct_answer": correct_answer,
+            "detected_answer": detected_answer,
+            "is_correct": bool(is_correct),
         }
-    ]
-
-    print("Executing Code 2...")
-    all_results = {}
-    for green_box in green_boxes_code2:
-        coordinates = green_box["coordinates"]
-        column_ranges = green_box["column_ranges"]
-        start_question = green_box["start_question"]
-        green_box_image, thresholded_green_box = setup_image_and_threshold(image_path, coordinates)
-        detected_circles = detect_filled_circles(thresholded_green_box)
-        _, black_filled_circles = count_black_filled_circles(thresholded_green_box, detected_circles)
-        box_results = analyze_all_rows(
-            green_box_image,
-            black_circles=black_filled_circles,
-            all_circles=detected_circles,
-            total_rows=10,
-            column_ranges=column_ranges,
-            start_question=start_question
+        for question_no, correct_answer, detected_answer, is_correct in zip(
+            answer_key.correct_answers.keys(), answer_key.correct_answers.values(),
+            answer_key.detected_answers(omr_results), is_correct_flags
         )
-        all_results.update(box_results)
-
-        # Highlight MCQ Circles
-        highlight_mcq_circles(green_box_image, black_filled_circles, detected_circles, column_ranges, total_rows=10)
-
-    # Compute results and store them
-    correct_answers_df = pd.read_csv(answers_csv_path)
-    correct_answers = dict(zip(correct_answers_df['question_no'], correct_answers_df['answer']))
-    total_marks = len(correct_answers)
-    obtained_marks = sum(1 for q, a in correct_answers.items() if all_results.get(q) == a)
-
-    # Save detailed results to the primary CSV
-    check_answers_and_store_results(all_results, answers_csv_path)
-
-    # Save the summary results
-    store_summary_results(roll_number_str, total_marks, obtained_marks)
-
-def process_single_file_for_folder(image_path, answers_csv_path):
-    #Process a single file and return summary results for folder processing.
-    # Reuse the logic from `process_single_file`
-    green_box_coordinates = (670, 250, 1000, 490)
-    column_x_coordinates_code1 = [40, 80, 120, 160, 200, 240, 280, 320]
-    row_y_coordinates_code1 = [50, 70, 90, 110, 130, 150, 170, 190, 207, 230]
-    row_labels_code1 = list(range(len(row_y_coordinates_code1)))
+    ]
+    return answer_rows, answer_key.total_marks, int(is_correct_flags.sum())
+
+# Debug output for headless runs
+class DebugSink:
+    #Write overlay images to disk, only for sheets that were flagged during headless grading.
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, sheet, reasons, regions):
+        #Render the overlays of a flagged sheet and save them next to a text file listing the reasons.
+        sheet_name = os.path.splitext(os.path.basename(sheet.image_path))[0]
+        for region_name, (coordinates, all_circles, filled_circles) in regions.items():
+            overlay = highlight_filled_and_unfilled_circles(sheet.crop(coordinates), all_circles, filled_circles, visualize=False)
+            cv2.imwrite(os.path.join(self.output_dir, f"{sheet_name}_{region_name}.png"), overlay)
+        with open(os.path.join(self.output_dir, f"{sheet_name}_flags.txt"), "w", encoding="utf-8") as flags_file:
+            flags_file.write("\n".join(reasons) + "\n")
+        print(f"Flagged sheet {sheet.image_path}: debug overlays saved to {self.output_dir}")
+
+def column_mark_counts(black_circles, field_layout):
+    #Count the filled circles in each digit column of a roll number or variant field.
+    counts = {}
+    for x, y, _ in black_circles:
+        col_index = lookup_index(field_layout.column_lookup, x)
+        row_index = lookup_index(field_layout.row_lookup, y)
+        if col_index >= 0 and row_index >= 0:
+            counts[col_index] = counts.get(col_index, 0) + 1
+    return counts
+
+def is_cleanly_marked(black_circles, field_layout):
+    #True when every digit column of the field has exactly one filled circle and nothing is marked outside them.
+    counts = column_mark_counts(black_circles, field_layout)
+    digit_columns = [col_index for col_index in range(len(field_layout.column_x_coordinates) - 1) if col_index not in field_layout.fixed_columns]
+    return len(black_circles) == len(digit_columns) and all(counts.get(col_index) == 1 for col_index in digit_columns)
+
+def flag_sheet(roll_black_circles, all_results, layout, variant_black_circles=None):
+    #Return the reasons a sheet needs manual review, or an empty list if it looks clean.
+    reasons = []
+    expected_digits = layout.roll_number.digit_count
+    if len(roll_black_circles) != expected_digits:
+        reasons.append(f"Roll number: {len(roll_black_circles)} filled circles for {expected_digits} digits")
+    if layout.variant is not None and not is_cleanly_marked(variant_black_circles, layout.variant):
+        reasons.append(f"Variant: {len(variant_black_circles)} filled circles, but each of the {layout.variant.digit_count} columns needs exactly one")
+    for question_no, answer in all_results.items():
+        if answer == "No answer detected":
+            reasons.append(f"Question {question_no}: no answer detected")
+    return reasons
+
+def read_omr_sheet(image_path, headless=False, debug_sink=None, layout=None, single_pass=False, register=False, threshold_mode="fixed"):
+    #Read the roll number and the detected answers from one OMR sheet.
+    # In headless mode no figures or overlays are produced; a debug sink receives only flagged sheets.
+    # The geometry comes from a compiled layout template, the 30-question sheet by default.
+    # single_pass=True finds the question box contours in one pass over their union instead of once per box.
+    # register=True corrects scanner skew and shift against the layout's reference corners before reading.
+    # threshold_mode="auto" adapts each region's threshold to the sheet's ink and paper levels.
+    # Returns the roll number, the detected answers and sheet info with the threshold used per region
+    # and the exam variant, which is None unless the layout has a variant field and it was marked cleanly.
+    if threshold_mode not in ("fixed", "auto"):
+        raise ValueError("Invalid threshold_mode. Use 'fixed' or 'auto'.")
+    visualize = not headless
+    layout = layout or load_layout()
+    roll_layout = layout.roll_number
+
+    # Decode the sheet once and share it across all regions
+    with pipeline_profile.stage("decode"):
+        sheet = OMRSheet(image_path)
+    if register and layout.registration:
+        with pipeline_profile.stage("register"):
+            sheet.register(layout.registration, layout.region_coordinates)
+    debug_regions = {}
+    thresholds = {}
 
     # Code 1 Execution
     print("Executing Code 1...")
-    green_box_image, thresholded_green_box = setup_image_and_threshold_basic(image_path, green_box_coordinates)
-    detected_circles = detect_filled_circles_basic(thresholded_green_box)
-    _, black_filled_circles = count_black_filled_circles(thresholded_green_box, detected_circles)
-    roll_number, visualization_image = analyze_all_columns_with_visualization(green_box_image, black_filled_circles, column_x_coordinates_code1, row_y_coordinates_code1, row_labels_code1)
-    plt.imshow(cv2.cvtColor(visualization_image, cv2.COLOR_BGR2RGB))
-    plt.title("Gridlines with Highlighted Circles and Row Labels (Code 1)")
-    plt.show()
+    green_box_coordinates = roll_layout.coordinates
+    row_labels_code1 = list(range(len(roll_layout.row_y_coordinates)))
+    roll_threshold = roll_layout.threshold
+    if threshold_mode == "auto":
+        with pipeline_profile.stage("auto_threshold"):
+            roll_threshold = auto_threshold(sheet.crop(green_box_coordinates), roll_layout.threshold)
+    thresholds["roll_number"] = roll_threshold
+    with pipeline_profile.stage("threshold"):
+        green_box_image, thresholded_green_box = setup_image_and_threshold_basic(sheet, green_box_coordinates, visualize=visualize, threshold_value=roll_threshold)
+    with pipeline_profile.stage("contours"):
+        detected_circles = detect_filled_circles_basic(thresholded_green_box, visualize=visualize, **roll_layout.detection)
+    with pipeline_profile.stage("fill_scoring"):
+        _, roll_black_circles = count_black_filled_circles(thresholded_green_box, detected_circles, layout.fill_ratio_threshold)
+    with pipeline_profile.stage("roll_analysis"):
+        roll_number, visualization_image = analyze_all_columns_with_visualization(
+            green_box_image, roll_black_circles, roll_layout.column_x_coordinates, roll_layout.row_y_coordinates, row_labels_code1,
+            visualize=visualize, column_lookup=roll_layout.column_lookup, row_lookup=roll_layout.row_lookup, fixed_columns=roll_layout.fixed_columns
+        )
+    if visualize:
+        show_image("Gridlines with Highlighted Circles and Row Labels (Code 1)", cv2.cvtColor(visualization_image, cv2.COLOR_BGR2RGB), cmap=None)
+    debug_regions["roll_number"] = (green_box_coordinates, detected_circles, roll_black_circles)
     roll_number_str = ''.join(roll_number)
     print(f"Detected Roll Number (Code 1): {roll_number_str}")
 
-    # Code 2 logic for question analysis
-    # Define the configuration for processing different green box sections on the OMR sheet
-    green_boxes_code2 = [
-        {
-            "coordinates": (0, 580, 860, 900),
-            "column_ranges": {
-                "A": (0, 750),
-                "B": (751, 790),
-                "C": (791, 820),
-                "D": (821, 850),
-            },
-            "start_question": 1,
-        },
-        {
-            "coordinates": (860, 580, 1035, 1100),
-            "column_ranges": {
-                "A": (0, 60),
-                "B": (61, 90),
-                "C": (91, 130),
-                "D": (131, 160),
-            },
-            "start_question": 11,
-        },
-        {
-            "coordinates": (1035, 580, 1600, 1100),
-            "column_ranges": {
-                "A": (0, 60),
-                "B": (61, 100),
-                "C": (101, 140),
-                "D": (141, 180),
-            },
-            "start_question": 21,
-        },
-    ]
+    # Exam variant digits, on sheets whose layout has a variant field
+    variant = None
+    variant_black_circles = None
+    variant_layout = layout.variant
+    if variant_layout is not None:
+        variant_threshold = variant_layout.threshold
+        if threshold_mode == "auto":
+            with pipeline_profile.stage("auto_threshold"):
+                variant_threshold = auto_threshold(sheet.crop(variant_layout.coordinates), variant_layout.threshold)
+        thresholds["variant"] = variant_threshold
+        with pipeline_profile.stage("threshold"):
+            variant_image, thresholded_variant = setup_image_and_threshold_basic(sheet, variant_layout.coordinates, visualize=False, threshold_value=variant_threshold)
+        with pipeline_profile.stage("contours"):
+            variant_circles = detect_filled_circles_basic(thresholded_variant, visualize=False, **variant_layout.detection)
+        with pipeline_profile.stage("fill_scoring"):
+            _, variant_black_circles = count_black_filled_circles(thresholded_variant, variant_circles, layout.fill_ratio_threshold)
+        with pipeline_profile.stage("roll_analysis"):
+            variant_digits, _ = analyze_all_columns_with_visualization(
+                variant_image, variant_black_circles, variant_layout.column_x_coordinates, variant_layout.row_y_coordinates, None,
+                visualize=False, column_lookup=variant_layout.column_lookup, row_lookup=variant_layout.row_lookup, fixed_columns=variant_layout.fixed_columns
+            )
+        debug_regions["variant"] = (variant_layout.coordinates, variant_circles, variant_black_circles)
+        # An unmarked or double-marked digit leaves the variant unknown rather than guessing
+        if is_cleanly_marked(variant_black_circles, variant_layout):
+            variant = ''.join(variant_digits)
+        print(f"Detected Variant: {variant}")
 
+    # Code 2 logic for question analysis
+    print("Executing Code 2...")
     all_results = {}
-    for green_box in green_boxes_code2:
-        coordinates = green_box["coordinates"]
-        column_ranges = green_box["column_ranges"]
-        start_question = green_box["start_question"]
-        green_box_image, thresholded_green_box = setup_image_and_threshold(image_path, coordinates)
-        detected_circles = detect_filled_circles(thresholded_green_box)
-        _, black_filled_circles = count_black_filled_circles(thresholded_green_box, detected_circles)
-        box_results = analyze_all_rows(
-            green_box_image,
-            black_circles=black_filled_circles,
-            all_circles=detected_circles,
-            total_rows=10,
-            column_ranges=column_ranges,
-            start_question=start_question
-        )
+    box_thresholds = [green_box.threshold for green_box in layout.question_boxes]
+    if threshold_mode == "auto":
+        with pipeline_profile.stage("auto_threshold"):
+            for box_index, green_box in enumerate(layout.question_boxes):
+                if single_pass:
+                    # Boxes sharing a contour pass share one threshold, measured over their union
+                    group = [box for box in layout.question_boxes if box.threshold == green_box.threshold]
+                    measured_region = sheet.crop(union_coordinates(group))
+                else:
+                    measured_region = sheet.crop(green_box.coordinates)
+                box_thresholds[box_index] = auto_threshold(measured_region, green_box.threshold)
+    routed_circles = None
+    if single_pass:
+        with pipeline_profile.stage("contours"):
+            routed_circles = detect_circles_single_pass(sheet, layout.question_boxes, box_thresholds)
+    for box_index, green_box in enumerate(layout.question_boxes):
+        coordinates = green_box.coordinates
+        column_ranges = green_box.column_ranges
+        start_question = green_box.start_question
+        thresholds[f"questions_{start_question}"] = box_thresholds[box_index]
+        with pipeline_profile.stage("threshold"):
+            green_box_image, thresholded_green_box = setup_image_and_threshold(sheet, coordinates, visualize=visualize, threshold_value=box_thresholds[box_index])
+        if routed_circles is not None:
+            detected_circles = routed_circles[box_index]
+        else:
+            with pipeline_profile.stage("contours"):
+                detected_circles = detect_filled_circles(thresholded_green_box, visualize=visualize, **green_box.detection)
+        with pipeline_profile.stage("fill_scoring"):
+            _, black_filled_circles = count_black_filled_circles(thresholded_green_box, detected_circles, layout.fill_ratio_threshold)
+        with pipeline_profile.stage("row_analysis"):
+            box_results = analyze_all_rows(
+                green_box_image,
+                black_circles=black_filled_circles,
+                all_circles=detected_circles,
+                total_rows=green_box.total_rows,
+                column_ranges=column_ranges,
+                start_question=start_question,
+                option_lookup=green_box.option_lookup
+            )
         all_results.update(box_results)
+        debug_regions[f"questions_{start_question}"] = (coordinates, detected_circles, black_filled_circles)
 
         # Highlight MCQ Circles
-        highlight_mcq_circles(green_box_image, black_filled_circles, detected_circles, column_ranges, total_rows=10)
+        if visualize:
+            highlight_mcq_circles(green_box_image, black_filled_circles, detected_circles, column_ranges, total_rows=green_box.total_rows)
 
-    # Compute marks
-    correct_answers_df = pd.read_csv(answers_csv_path)
-    correct_answers = dict(zip(correct_answers_df['question_no'], correct_answers_df['answer']))
-    total_marks = len(correct_answers)
-    obtained_marks = sum(1 for q, a in correct_answers.items() if all_results.get(q) == a)
-    return roll_number_str, total_marks, obtained_marks
+    if debug_sink is not None:
+        reasons = flag_sheet(roll_black_circles, all_results, layout, variant_black_circles)
+        if reasons:
+            with pipeline_profile.stage("debug_output"):
+                debug_sink.write(sheet, reasons, debug_regions)
+
+    return roll_number_str, all_results, {"thresholds": thresholds, "variant": variant}
 
-def process_folder(folder_path):
-    #Process multiple images and corresponding answer CSVs from a single folder and save results to a single CSV.
+def process_single_file(image_path, answers_csv_path, results_store=None, profile=None, **read_options):
+    #Process a single image and corresponding answer CSV file, saving the results to the results store.
+    # read_options (headless, debug_sink, layout, single_pass, register, threshold_mode) are passed on to read_omr_sheet.
+    # profile, a BatchProfile, collects the per-stage timings of the sheet.
+    print(f"Processing single file: {image_path}")
+    summary, answer_rows, timings = process_single_file_for_folder(image_path, answers_csv_path, **read_options)
+    with nullcontext(results_store) if results_store is not None else ResultsStore() as store:
+        write_started = time.perf_counter()
+        store.add_sheet(summary, answer_rows, image_path, answers_csv_path)
+        store.flush()
+        if profile is not None:
+            profile.add(timings)
+            profile.record("store_write", time.perf_counter() - write_started)
+        print(f"{summary['Roll Number']} scored {summary['Obtained Marks']}/{summary['Total Marks']}; results saved to {store.path} (run {store.run_id})")
+
+def process_single_file_for_folder(image_path, answers_csv_path, **read_options):
+    #Process a single file and return its summary row, per-question rows and per-stage timings.
+    pipeline_profile.begin_sheet()
+    try:
+        with pipeline_profile.stage("total"):
+            roll_number_str, all_results, sheet_info = read_omr_sheet(image_path, **read_options)
+
+            # Compute marks
+            answer_rows, total_marks, obtained_marks = grade_answers(all_results, answers_csv_path, sheet_info["variant"])
+    finally:
+        timings = pipeline_profile.end_sheet()
+    summary = {
+        "Roll Number": roll_number_str,
+        "Total Marks": total_marks,
+        "Obtained Marks": obtained_marks,
+        "Thresholds": format_thresholds(sheet_info["thresholds"]),
+        "Variant": sheet_info["variant"],
+    }
+    return summary, answer_rows, timings
+
+def _init_grading_worker():
+    #Keep OpenCV single-threaded inside pool workers so the processes do not oversubscribe the cores.
+    cv2.setNumThreads(1)
+
+def _grade_pair(job):
+    #Grade one image/CSV pair, returning the error message instead of raising so one bad sheet cannot abort a batch.
+    image_path, csv_path, options = job
+    try:
+        return process_single_file_for_folder(image_path, csv_path, **options), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def process_folder(folder_path, headless=False, workers=1, results_store=None, profile=None, answers_csv_path=None, progress=None, cancel_event=None, **read_options):
+    #Process multiple images and corresponding answer CSVs from a single folder and save results to the results store.
+    # answers_csv_path, if given, is used for every image without its own CSV, e.g. a variant answer key.
+    # progress(done, total) is called after every sheet; setting cancel_event stops the batch after the
+    # sheets in progress, and the results graded so far are still saved.
+    # With workers > 1 the sheets are graded headless on a process pool; the results keep the input order.
+    # profile, a BatchProfile, collects the per-stage timings of every graded sheet.
     print(f"Processing folder: {folder_path}")
-    all_results = []
 
     # Ensure folder exists
     if not os.path.isdir(folder_path):
         raise ValueError("The specified folder does not exist.")
 
-    # Get all files in the folder
-    files = os.listdir(folder_path)
+    # Get all files in the folder, sorted so the output order is deterministic
+    files = sorted(os.listdir(folder_path))
 
     # Filter and pair files by their names (matching .png and .csv)
     paired_files = {}
     for file in files:
         name, ext = os.path.splitext(file)
         if ext == ".png":
-            paired_files[name] = {"image": os.path.join(folder_path, file)}
+            paired_files.setdefault(name, {})["image"] = os.path.join(folder_path, file)
         elif ext == ".csv":
             paired_files.setdefault(name, {})["csv"] = os.path.join(folder_path, file)
 
-    # Process each pair
+    options = dict(read_options, headless=headless)
+    jobs = []
     for name, paths in paired_files.items():
-        if "image" in paths and "csv" in paths:
-            image_path = paths["image"]
-            csv_path = paths["csv"]
-            print(f"Processing: {image_path} with {csv_path}")
-            roll_number, total_marks, obtained_marks = process_single_file_for_folder(image_path, csv_path)
-            all_results.append({
-                "Roll Number": roll_number,
-                "Total Marks": total_marks,
-                "Obtained Marks": obtained_marks,
-            })
+        if "image" in paths and ("csv" in paths or answers_csv_path):
+            jobs.append((paths["image"], paths.get("csv", answers_csv_path), options))
+        elif "image" not in paths and answers_csv_path and os.path.abspath(paths["csv"]) == os.path.abspath(answers_csv_path):
+            continue  # The shared answer key kept in the same folder
         else:
             print(f"Missing pair for: {name}")
 
-    # Save all results to a single CSV file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_csv = f"summary_results_{timestamp}.csv"
-    pd.DataFrame(all_results).to_csv(output_csv, index=False)
-    print(f"Summary results saved to {output_csv}")
-
-def process_main(image_path_or_folder, answers_csv_path_or_folder, process_mode="single"):
+    # Process each pair, handing every result to the results store as soon as it is graded, so the store's
+    # batch_size and flush_interval commits apply during the run and a crash loses at most one batch
+    graded_count = 0
+    failure_count = 0
+    with nullcontext(results_store) if results_store is not None else ResultsStore() as store:
+        def record(job, outcome):
+            nonlocal graded_count, failure_count
+            image_path, csv_path, _ = job
+            graded, error = outcome
+            graded_count += 1
+            if error is not None:
+                print(f"Failed to process {image_path}: {error}")
+                store.add_failure(image_path, csv_path, error)
+                failure_count += 1
+            else:
+                summary, answer_rows, timings = graded
+                write_started = time.perf_counter()
+                store.add_sheet(summary, answer_rows, image_path, csv_path)
+                if profile is not None:
+                    profile.add(timings)
+                    profile.record("store_write", time.perf_counter() - write_started)
+            if progress is not None:
+                progress(graded_count, len(jobs))
+
+        if workers > 1 and len(jobs) > 1:
+            if not headless:
+                print("Parallel grading runs headless; image windows are disabled.")
+            options["headless"] = True
+            chunksize = max(1, len(jobs) // (workers * 4))
+            if progress is not None or cancel_event is not None:
+                chunksize = min(chunksize, 4)  # Small chunks keep progress smooth and let a cancel take effect promptly
+            # A sheet that crashes its worker process breaks the whole pool. The sheets in progress are then
+            # regraded one at a time on a single-worker pool, so only the sheet that crashed is recorded as
+            # failed, and the rest of the batch carries on with a fresh pool.
+            position = 0
+            isolate_until = 0
+            while position < len(jobs) and not (cancel_event is not None and cancel_event.is_set()):
+                isolating = position < isolate_until
+                batch = jobs[position:isolate_until] if isolating else jobs[position:]
+                executor = ProcessPoolExecutor(max_workers=1 if isolating else workers, initializer=_init_grading_worker)
+                try:
+                    for outcome in executor.map(_grade_pair, batch, chunksize=1 if isolating else chunksize):
+                        record(jobs[position], outcome)
+                        position += 1
+                        if cancel_event is not None and cancel_event.is_set():
+                            break
+                except BrokenProcessPool:
+                    if isolating:
+                        record(jobs[position], (None, "BrokenProcessPool: the grading process crashed on this sheet"))
+                        position += 1
+                    else:
+                        print("A grading process crashed; regrading the sheets in progress one at a time.")
+                        isolate_until = min(len(jobs), position + (workers + 1) * chunksize)
+                finally:
+                    executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            for job in jobs:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                print(f"Processing: {job[0]} with {job[1]}")
+                record(job, _grade_pair(job))
+        if graded_count < len(jobs):
+            print(f"Cancelled after {graded_count} of {len(jobs)} sheet(s)")
+
+        store.flush()
+        print(f"Results for {graded_count - failure_count} sheet(s) saved to {store.path} (run {store.run_id})")
+        if failure_count:
+            print(f"{failure_count} sheet(s) failed; details saved to the failures table")
+
+def _ready_pairs(folder_path, answers_csv_path, settle_seconds, exclude, limit):
+    #Yield up to `limit` complete (name, image, csv) pairs whose files have not been modified for settle_seconds.
+    now = time.time()
+    images, csvs = {}, {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            name, ext = os.path.splitext(entry.name)
+            if name in exclude or now - entry.stat().st_mtime < settle_seconds:
+                continue  # Already queued, or the scanner may still be writing it
+            if ext == ".png":
+                images[name] = entry.path
+            elif ext == ".csv":
+                csvs[name] = entry.path
+    found = 0
+    for name in sorted(images):
+        csv_path = answers_csv_path or csvs.get(name)
+        if csv_path is None:
+            continue  # Wait for the answer CSV to land
+        yield name, images[name], csv_path
+        found += 1
+        if found >= limit:
+            return
+
+def _move_into(paths, destination_folder):
+    #Move graded files out of the watched folder so it never grows and a restart never re-grades them.
+    os.makedirs(destination_folder, exist_ok=True)
+    for path in paths:
+        shutil.move(path, os.path.join(destination_folder, os.path.basename(path)))
+
+def _commit_and_move(store, pending_moves, excluded_names):
+    #Commit the stored results, then move the files of every committed sheet out of the watched folder.
+    store.flush()
+    for name, own_files, destination_folder in pending_moves:
+        _move_into(own_files, destination_folder)
+        excluded_names.discard(name)
+    pending_moves.clear()
+
+def watch_folder(folder_path, answers_csv_path=None, workers=1, poll_interval=1.0, settle_seconds=2.0, queue_size=64, idle_timeout=None, results_store=None, profile=None, progress=None, cancel_event=None, **read_options):
+    #Grade sheets as they land in a folder, appending each result to the results store as soon as it is ready.
+    # A sheet is ready once its PNG and CSV (or the shared answers_csv_path) exist and have stopped changing.
+    # At most queue_size pairs are in flight, and graded files move to "graded/" or "failed/" once their
+    # results are committed, so memory stays constant however many sheets arrive and a crash never loses
+    # a sheet whose files were moved. Stops after idle_timeout seconds without work.
+    # profile, a BatchProfile, collects the per-stage timings of every graded sheet.
+    # progress(done, None) is called after every sheet; setting cancel_event stops the watch.
+    if not os.path.isdir(folder_path):
+        raise ValueError("The specified folder does not exist.")
+    print(f"Watching folder: {folder_path}")
+    pending_moves = []  # (name, files, destination) waiting for their results to be committed
+    graded_folder = os.path.join(folder_path, "graded")
+    failed_folder = os.path.join(folder_path, "failed")
+    shared_key = os.path.abspath(answers_csv_path) if answers_csv_path else None
+    options = dict(read_options, headless=True)
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_grading_worker) if workers > 1 else None
+    in_flight = deque()  # (name, image, csv, future) in submission order
+    excluded_names = set()  # Queued, or graded but not yet moved
+    graded_count = 0
+    last_activity = time.monotonic()
+    with nullcontext(results_store) if results_store is not None else ResultsStore() as store:
+        try:
+            while True:
+                # Fill the bounded queue with newly completed pairs
+                capacity = queue_size - len(in_flight)
+                if capacity > 0:
+                    for name, image_path, csv_path in _ready_pairs(folder_path, shared_key, settle_seconds, excluded_names, capacity):
+                        job = (image_path, csv_path, options)
+                        if executor is not None:
+                            future = executor.submit(_grade_pair, job)
+                        else:
+                            future = Future()
+                            future.set_result(_grade_pair(job))
+                        in_flight.append((name, image_path, csv_path, future))
+                        excluded_names.add(name)
+                        last_activity = time.monotonic()
+
+                # Store results in arrival order as soon as they are done
+                while in_flight and in_flight[0][3].done():
+                    name, image_path, csv_path, future = in_flight.popleft()
+                    graded, error = future.result()
+                    own_files = [image_path] if csv_path == shared_key else [image_path, csv_path]
+                    if error is None:
+                        summary, answer_rows, timings = graded
+                        write_started = time.perf_counter()
+                        store.add_sheet(summary, answer_rows, image_path, csv_path)
+                        if profile is not None:
+                            profile.add(timings)
+                            profile.record("store_write", time.perf_counter() - write_started)
+                        pending_moves.append((name, own_files, graded_folder))
+                        graded_count += 1
+                        print(f"Graded {image_path}: {summary['Roll Number']} scored {summary['Obtained Marks']}/{summary['Total Marks']}")
+                    else:
+                        print(f"Failed to process {image_path}: {error}")
+                        store.add_failure(image_path, csv_path, error)
+                        pending_moves.append((name, own_files, failed_folder))
+                    last_activity = time.monotonic()
+                    if progress is not None:
+                        progress(graded_count, None)
+
+                # Move files only once their results are committed
+                if pending_moves and (not in_flight or len(pending_moves) >= store.batch_size or store.flush_if_due()):
+                    _commit_and_move(store, pending_moves, excluded_names)
+
+                if not in_flight and idle_timeout is not None and time.monotonic() - last_activity >= idle_timeout:
+                    break
+                if cancel_event is not None and cancel_event.is_set():
+                    print("Stopping folder watch.")
+                    break
+                time.sleep(poll_interval if not in_flight else min(poll_interval, 0.05))
+        except KeyboardInterrupt:
+            print("Stopping folder watch.")
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+            _commit_and_move(store, pending_moves, excluded_names)
+        print(f"Graded {graded_count} sheet(s); results saved to {store.path} (run {store.run_id})")
+
+def process_main(image_path_or_folder, answers_csv_path_or_folder, process_mode="single", headless=False, debug_dir=None, workers=1, idle_timeout=None, layout_path=None, single_pass=False, register=False, threshold_mode="fixed", results_path=DEFAULT_RESULTS_PATH, profile_path=None, progress=None, cancel_event=None):
     #Main function to process OMR sheets and answers.
-    if process_mode == "single":
-        # Single file processing logic
-        process_single_file(image_path_or_folder, answers_csv_path_or_folder)
-    elif process_mode == "multiple":
-        # Folder processing logic
-        process_folder(image_path_or_folder)
-    else:
-        raise ValueError("Invalid process_mode. Use 'single' or 'multiple'.")
+    # headless=True skips every figure and overlay; debug_dir saves overlays for flagged sheets only.
+    # workers sets the number of grading processes used in "multiple" and "watch" mode.
+    # "watch" mode grades sheets as they arrive, optionally against one shared answer CSV, and always runs headless.
+    # layout_path selects a JSON sheet layout template; the 30-question sheet is used by default.
+    # In "multiple" mode answers_csv_path_or_folder may name one answer CSV shared by every sheet without its own.
+    # A variant answer key CSV (variant, question_no, answer) grades each sheet against the variant read from it.
+    # single_pass=True shares one threshold and contour pass across the question boxes.
+    # register=True aligns skewed or shifted scans to the layout before the regions are read.
+    # threshold_mode="auto" adapts the thresholds to each sheet; the values used are saved with the results.
+    # Results of every run are appended to the SQLite results store at results_path.
+    # profile_path saves per-stage p50/p95/p99 latencies for the run as JSON, or CSV for a .csv path.
+    # progress(done, total) reports each graded sheet and cancel_event stops a folder run early, for callers
+    # running the batch on a background thread.
+    debug_sink = DebugSink(debug_dir) if debug_dir else None
+    read_options = {
+        "debug_sink": debug_sink,
+        "layout": load_layout(layout_path),
+        "single_pass": single_pass,
+        "register": register,
+        "threshold_mode": threshold_mode,
+    }
+    if process_mode not in ("single", "multiple", "watch"):
+        raise ValueError("Invalid process_mode. Use 'single', 'multiple' or 'watch'.")
+    profile = BatchProfile() if profile_path else None
+    with ResultsStore(results_path) as results_store:
+        if process_mode == "single":
+            # Single file processing logic
+            process_single_file(image_path_or_folder, answers_csv_path_or_folder, results_store=results_store, profile=profile, headless=headless, **read_options)
+            if progress is not None:
+                progress(1, 1)
+        elif process_mode == "multiple":
+            # Folder processing logic
+            process_folder(image_path_or_folder, headless=headless, workers=workers, results_store=results_store, profile=profile, answers_csv_path=answers_csv_path_or_folder, progress=progress, cancel_event=cancel_event, **read_options)
+        else:
+            # Streaming folder processing logic
+            watch_folder(image_path_or_folder, answers_csv_path_or_folder, workers=workers, idle_timeout=idle_timeout, results_store=results_store, profile=profile, progress=progress, cancel_event=cancel_event, **read_options)
+    if profile is not None:
+        profile.report()
+        profile.export(profile_path)
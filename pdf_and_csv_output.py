@@ -1,8 +1,166 @@
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-import pandas as pd
-
-def save_mcqs_to_pdf(mcq_list, file_name):
+from reportlab.pdfbase import pdfmetrics
+import csv
+import re
+
+# Glyph width tables per (font name, font size), shared by every paper rendered in this process
+_font_metrics = {}
+
+class FontMetrics:
+    #Text widths from the font's real metrics, with each glyph's width measured once and cached.
+    def __init__(self, font_name, font_size):
+        self.font_name = font_name
+        self.font_size = font_size
+        self._widths = {}
+
+    def glyph_width(self, glyph):
+        width = self._widths.get(glyph)
+        if width is None:
+            width = self._widths[glyph] = pdfmetrics.stringWidth(glyph, self.font_name, self.font_size)
+        return width
+
+    def width(self, text):
+        return sum(self.glyph_width(glyph) for glyph in text)
+
+def font_metrics(font_name, font_size):
+    #Return the shared FontMetrics for a font and size.
+    metrics = _font_metrics.get((font_name, font_size))
+    if metrics is None:
+        metrics = _font_metrics[(font_name, font_size)] = FontMetrics(font_name, font_size)
+    return metrics
+
+# Leading label of a question or option line ("12. ", "a) "), used as the hanging indent of wrapped lines
+LABEL_PATTERN = re.compile(r"^\s*(?:\d+\.|[A-Za-z]\))\s+")
+
+def wrap_line(line, max_width, metrics):
+    #Wrap one line to max_width in a single pass over its words; returns [(indent, text)] in points.
+    # Continuation lines are indented past the question or option label; a word wider than the line
+    # is broken between glyphs.
+    label = LABEL_PATTERN.match(line)
+    hanging_indent = metrics.width(label.group(0)) if label else 0
+    if hanging_indent > max_width / 2:
+        hanging_indent = 0
+    wrapped = []
+    indent, available = 0, max_width
+    current, current_width = "", 0
+    for word in re.findall(r"\S+\s*", line):
+        word_width = metrics.width(word)
+        # Trailing spaces may overhang the margin
+        stripped_width = word_width - metrics.width(word[len(word.rstrip()):])
+        if current and current_width + stripped_width > available:
+            wrapped.append((indent, current.rstrip()))
+            indent, available = hanging_indent, max_width - hanging_indent
+            current, current_width = "", 0
+        while stripped_width > available:
+            # Break an overlong word at the last glyph that fits
+            fitted, fitted_width = "", 0
+            for glyph in word:
+                glyph_width = metrics.glyph_width(glyph)
+                if fitted and fitted_width + glyph_width > available:
+                    break
+                fitted += glyph
+                fitted_width += glyph_width
+            wrapped.append((indent, fitted))
+            indent, available = hanging_indent, max_width - hanging_indent
+            word = word[len(fitted):]
+            word_width -= fitted_width
+            stripped_width -= fitted_width
+        current += word
+        current_width += word_width
+    if current.strip() or not wrapped:
+        wrapped.append((indent, current.rstrip()))
+    return wrapped
+
+class PageTemplate:
+    #Page size, margins, font and decorations shared by every page of every paper rendered with it.
+    # Geometry and font metrics are computed once; the header and rule are compiled into a PDF form per
+    # document and stamped on each page, and only the page number is drawn afresh.
+    def __init__(self, page_size=A4, margin=50, font_name="Helvetica", font_size=12, line_height=15, title="MCQs", header=None, footer="Page {page}"):
+        self.page_size = page_size
+        self.font_name = font_name
+        self.font_size = font_size
+        self.line_height = line_height
+        self.title = title
+        self.header = header
+        self.footer = footer
+        page_width, page_height = page_size
+        self.left_margin = margin
+        self.right_margin = page_width - margin
+        self.top_margin = page_height - margin
+        self.bottom_margin = margin
+        self.text_width = self.right_margin - self.left_margin
+        self.metrics = font_metrics(font_name, font_size)
+
+    def text_top(self, header):
+        #Baseline of the first text line, below the header and its rule when there is one.
+        return self.top_margin - 2 * self.line_height if header else self.top_margin
+
+    def begin(self, file_name, header):
+        #Open a canvas for one paper and compile its header into a form.
+        pdf = canvas.Canvas(file_name, pagesize=self.page_size, initialFontName=self.font_name, initialFontSize=self.font_size, initialLeading=self.line_height)
+        pdf.setTitle(self.title)
+        if header:
+            rule_y = self.top_margin - self.line_height / 2
+            pdf.beginForm("page_header")
+            pdf.drawString(self.left_margin, self.top_margin, header)
+            pdf.line(self.left_margin, rule_y, self.right_margin, rule_y)
+            pdf.endForm()
+        return pdf
+
+    def decorate(self, pdf, page_number, header):
+        #Stamp the header form and the footer on the current page.
+        if header:
+            pdf.doForm("page_header")
+        if self.footer:
+            pdf.drawRightString(self.right_margin, self.bottom_margin / 2, self.footer.format(page=page_number))
+
+def render_paper(mcq_list, file_name, template, header=None):
+    #Lay out a list of MCQ lines on pages from the template and save the PDF.
+    # header overrides the template's header text for this paper.
+    header = header or template.header
+    pdf = template.begin(file_name, header)
+    page_number = 1
+    template.decorate(pdf, page_number, header)
+    text = pdf.beginText()
+    top = y_position = template.text_top(header)
+
+    def new_page():
+        nonlocal text, page_number
+        pdf.drawText(text)
+        pdf.showPage()
+        page_number += 1
+        template.decorate(pdf, page_number, header)
+        text = pdf.beginText()
+        return top
+
+    for mcq in mcq_list:
+        # Split the MCQ into lines (question, options, answer)
+        for line in mcq.split("\n"):
+            for indent, part in wrap_line(line, template.text_width, template.metrics):
+                if y_position < template.bottom_margin:
+                    y_position = new_page()
+                text.setTextOrigin(template.left_margin + indent, y_position)
+                text.textOut(part)
+                y_position -= template.line_height
+
+        # Add extra space between MCQs
+        y_position -= template.line_height
+
+    pdf.drawText(text)
+    pdf.save()
+
+def render_papers(papers, template=None):
+    #Render many papers in one process, sharing one template and its font metrics.
+    # papers is an iterable of (mcq_list, file_name) or (mcq_list, file_name, header) tuples.
+    template = template or PageTemplate()
+    for paper in papers:
+        render_paper(*paper[:2], template, *paper[2:])
+
+# Template used when save_mcqs_to_pdf is called without one
+DEFAULT_TEMPLATE = PageTemplate()
+
+def save_mcqs_to_pdf(mcq_list, file_name, template=None, header=None):
     #Save a list of MCQs to a PDF file.
 
     try:
@@ -10,63 +168,7 @@ def save_mcqs_to_pdf(mcq_list, file_name):
         if not file_name.endswith('.pdf'):
             raise ValueError("File name must end with .pdf")
 
-        # Initialize the PDF canvas with A4 page size
-        pdf = canvas.Canvas(file_name, pagesize=A4)
-        pdf.setTitle("MCQs")  # Set the title of the PDF
-        pdf.setFont("Helvetica", 12)  # Set the font style and size
-
-        # Get the width and height of the A4 page
-        page_width, page_height = A4
-
-        # Define margins
-        left_margin = 50
-        right_margin = page_width - 50
-        top_margin = page_height - 50
-        bottom_margin = 50
-
-        # Set initial x and y positions
-        x_position = left_margin
-        y_position = top_margin
-        line_height = 15  # Line height for text spacing
-
-        # Iterate through the MCQs
-        for mcq in mcq_list:
-            # Split the MCQ into lines (question, options, answer)
-            lines = mcq.split("\n")
-
-            for line in lines:
-                # Handle text that exceeds the right margin
-                if len(line) * 6 + x_position > right_margin:
-                    # Split long text into two lines
-                    split_index = int((right_margin - x_position) / 6)
-                    first_part = line[:split_index]
-                    second_part = line[split_index:]
-                    pdf.drawString(x_position, y_position, first_part)
-                    y_position -= line_height
-                    pdf.drawString(x_position, y_position, second_part)
-                else:
-                    # Draw text if it fits within the margins
-                    pdf.drawString(x_position, y_position, line)
-
-                # Move to the next line
-                y_position -= line_height
-
-                # Add a new page if the text exceeds the bottom margin
-                if y_position < bottom_margin:
-                    pdf.showPage()
-                    pdf.setFont("Helvetica", 12)  # Reset font for new page
-                    y_position = top_margin
-
-            # Add extra space between MCQs
-            y_position -= line_height
-
-            # Add a new page if the extra space exceeds the bottom margin
-            if y_position < bottom_margin:
-                pdf.showPage()
-                pdf.setFont("Helvetica", 12)  # Reset font for new page
-                y_position = top_margin
-
-        pdf.save()
+        render_paper(mcq_list, file_name, template or DEFAULT_TEMPLATE, header)
 
     except PermissionError:
         print(f"Permission denied: Unable to save the file '{file_name}'. Please check the file path and try again.")
@@ -78,7 +180,7 @@ def save_mcqs_to_pdf(mcq_list, file_name):
         print(f"An unexpected error occurred: {exception}")
 
 
-def save_answers_to_csv(answer_data, file_name):
+def save_answers_to_csv(answer_data, file_name, columns=("question_no", "answer")):
     #Save question numbers and answers to a CSV file.
 
     try:
@@ -86,11 +188,11 @@ def save_answers_to_csv(answer_data, file_name):
         if not answer_data:
             raise ValueError("Answer data is empty. Cannot save to CSV.")
 
-        # Create a DataFrame from the answer data
-        data_frame = pd.DataFrame(answer_data, columns=["question_no", "answer"])
-
-        # Save the DataFrame to a CSV file without the index
-        data_frame.to_csv(file_name, index=False, encoding="utf-8")
+        # Write the header and one row per question; the csv module keeps pandas out of paper rendering
+        with open(file_name, "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.writer(csv_file, lineterminator="\n")
+            writer.writerow(columns)
+            writer.writerows(answer_data)
 
     except Exception as exception:
         raise RuntimeError(f"Failed to save CSV file: {exception}")
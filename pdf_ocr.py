@@ -0,0 +1,94 @@
+import hashlib
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+from content_cache import default_cache, key_digest
+
+# Optional: OCR needs pypdfium2 to rasterize pages and pytesseract with a local Tesseract install
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# Bump when rendering or OCR settings change, so cached OCR text from older versions is not reused
+OCR_VERSION = 1
+DEFAULT_OCR_DPI = 300
+DEFAULT_OCR_LANGUAGE = "eng"
+
+def ocr_unavailable_reason():
+    #Return why OCR cannot run here, or None when it can.
+    if pypdfium2 is None:
+        return "pypdfium2 is not installed (pip install pypdfium2)"
+    if pytesseract is None:
+        return "pytesseract is not installed (pip install pytesseract)"
+    if shutil.which(pytesseract.pytesseract.tesseract_cmd) is None:
+        return "the Tesseract OCR engine was not found on PATH"
+    return None
+
+def page_digest(page):
+    #SHA-256 of a page's content stream and the images and forms it draws.
+    # Scanned pages usually share the same one-line content stream, so the image data is what tells them apart.
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            digest.update(name.encode("utf-8"))
+            try:
+                digest.update(xobjects[name].get_object().get_data())
+            except Exception:
+                # Undecodable streams still hash by their raw bytes
+                digest.update(getattr(xobjects[name].get_object(), "_data", b""))
+    return digest.hexdigest()
+
+def _ocr_page(job):
+    #Render one page and run it through Tesseract in a worker process.
+    file_path, page_number, dpi, language = job
+    document = pypdfium2.PdfDocument(file_path)
+    try:
+        image = document[page_number - 1].render(scale=dpi / 72).to_pil().convert("L")
+    finally:
+        document.close()
+    return page_number, pytesseract.image_to_string(image, lang=language).strip()
+
+def ocr_pages(file_path, page_numbers, workers=2, dpi=DEFAULT_OCR_DPI, language=DEFAULT_OCR_LANGUAGE, use_cache=True):
+    #OCR the given pages of a PDF and return {page number: text}.
+    # Pages are rasterized and recognized in a pool of at most workers processes. Results are cached by
+    # each page's content hash, so the same scan inside another PDF is not OCRed again. Returns an empty
+    # dict, with a warning, when the OCR dependencies are missing.
+    reason = ocr_unavailable_reason()
+    if reason:
+        print(f"Warning: OCR skipped, {reason}.")
+        return {}
+
+    cache = default_cache() if use_cache else None
+    pdf_reader = PdfReader(file_path)
+    texts, cache_keys, jobs = {}, {}, []
+    for page_number in page_numbers:
+        if cache is not None:
+            cache_keys[page_number] = key_digest(page_digest(pdf_reader.pages[page_number - 1]), dpi, language, OCR_VERSION)
+            cached_text = cache.get("ocr", cache_keys[page_number])
+            if cached_text is not None:
+                texts[page_number] = cached_text
+                continue
+        jobs.append((file_path, page_number, dpi, language))
+
+    if len(jobs) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            results = list(executor.map(_ocr_page, jobs))
+    else:
+        results = [_ocr_page(job) for job in jobs]
+
+    for page_number, text in results:
+        texts[page_number] = text
+        if cache is not None:
+            cache.set("ocr", cache_keys[page_number], text)
+    return texts
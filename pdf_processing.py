@@ -1,28 +1,84 @@
 from PyPDF2 import PdfReader
 import os
+from concurrent.futures import ProcessPoolExecutor
+from text_chunking import PAGE_BREAK
+from content_cache import default_cache, file_digest, key_digest
+from pdf_ocr import DEFAULT_OCR_LANGUAGE, ocr_pages, ocr_unavailable_reason
 
-def extract_text_from_pdf(file_path):
+# Bump when the extraction output changes, so cached text from older versions is not reused
+TEXT_EXTRACTION_VERSION = 1
+
+def _extract_page_range(file_path, start, stop):
+    #Extract (page number, text) for pages start..stop-1 in a worker process, with its own reader.
+    pdf_reader = PdfReader(file_path)
+    return [(index + 1, pdf_reader.pages[index].extract_text() or "") for index in range(start, stop)]
+
+def iter_pdf_pages(file_path, workers=1, pages_per_task=None):
+    #Yield (page number, text) for every page in order, as soon as each page is extracted.
+    # With workers > 1, ranges of pages_per_task pages are extracted in parallel processes. By default
+    # each worker gets about four ranges, since every range re-opens the PDF. At most 2 * workers
+    # ranges are in flight, so memory stays bounded however long the document is.
+    pdf_reader = PdfReader(file_path)
+    page_count = len(pdf_reader.pages)
+    if pages_per_task is None:
+        pages_per_task = max(16, -(-page_count // (workers * 4)))
+    if workers <= 1 or page_count <= pages_per_task:
+        for index, page in enumerate(pdf_reader.pages):
+            yield index + 1, page.extract_text() or ""
+        return
+
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < 2 * workers:
+                pending.append(executor.submit(_extract_page_range, file_path, *ranges[next_range]))
+                next_range += 1
+            # Yield ranges in document order; later ranges keep extracting in the background
+            yield from pending.pop(0).result()
+
+def extract_text_from_pdf(file_path, use_cache=True, workers=1, ocr=False, ocr_workers=2, ocr_language=DEFAULT_OCR_LANGUAGE):
     #Extract text from a PDF file.
+    # The text is cached by the file's content hash; use_cache=False always re-reads the PDF.
+    # workers > 1 extracts page ranges in parallel processes, which helps with long documents.
+    # ocr=True runs pages without a text layer (scans) through local OCR instead of dropping them.
 
     # Check if the file exists
     if not os.path.isfile(file_path):
         raise FileNotFoundError(f"The file '{file_path}' was not found.")
 
-    try:
-        # Initialize the PDF reader
-        pdf_reader = PdfReader(file_path)
-        extracted_text = ""
+    if ocr and ocr_unavailable_reason():
+        print(f"Warning: OCR fallback disabled, {ocr_unavailable_reason()}.")
+        ocr = False
+
+    cache = default_cache() if use_cache else None
+    if cache is not None:
+        cache_key = key_digest(file_digest(file_path), TEXT_EXTRACTION_VERSION, ocr_language if ocr else None)
+        cached_text = cache.get("pdf_text", cache_key)
+        if cached_text is not None:
+            return cached_text
 
-        # Iterate through all pages to extract text
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
+    try:
+        page_texts = {}
+        empty_pages = []
+        for page_number, page_text in iter_pdf_pages(file_path, workers=workers):
             if page_text:
-                extracted_text += page_text  # Append text from the current page
+                page_texts[page_number] = page_text
             else:
+                empty_pages.append(page_number)
+
+        if ocr and empty_pages:
+            page_texts.update((page_number, text) for page_number, text in ocr_pages(file_path, empty_pages, workers=ocr_workers, language=ocr_language, use_cache=use_cache).items() if text)
+        for page_number in empty_pages:
+            if page_number not in page_texts:
                 # Warn if no text is found on a page
-                page_number = pdf_reader.pages.index(page) + 1
                 print(f"Warning: No text found on page {page_number}")
 
+        # Keep page boundaries for chunking
+        extracted_text = PAGE_BREAK.join(page_texts[page_number] for page_number in sorted(page_texts))
+        if cache is not None:
+            cache.set("pdf_text", cache_key, extracted_text)
         return extracted_text
 
     except PermissionError:
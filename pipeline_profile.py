@@ -0,0 +1,143 @@
+import csv
+import json
+import os
+import threading
+import time
+import numpy as np
+
+class SheetTimings:
+    #Stage durations (seconds, summed over regions) and counters recorded while grading one sheet.
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    def stage(self, name):
+        #Return a context manager that adds the time spent in its block to a stage.
+        return _StageTimer(self.stages, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def as_dict(self):
+        #Plain dict form, cheap to send back from a worker process.
+        return {"stages": dict(self.stages), "counters": dict(self.counters)}
+
+class _StageTimer:
+    #Context manager adding elapsed perf_counter time to one entry of a stage dict.
+    __slots__ = ("stages", "name", "start")
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stages[self.name] = self.stages.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+class _NullTimer:
+    #Stand-in used when no sheet is being timed.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+# Timings of the sheet being graded by each thread, if any, so concurrent jobs in one process stay separate
+_local = threading.local()
+
+def begin_sheet():
+    #Start timing a new sheet in this thread and return its timings.
+    _local.timings = SheetTimings()
+    return _local.timings
+
+def end_sheet():
+    #Stop timing the current sheet and return its timings as a dict.
+    timings = getattr(_local, "timings", None)
+    _local.timings = None
+    return timings.as_dict() if timings is not None else {"stages": {}, "counters": {}}
+
+def stage(name):
+    #Time a block as part of the current sheet; a no-op when no sheet is being timed.
+    timings = getattr(_local, "timings", None)
+    return timings.stage(name) if timings is not None else _NULL_TIMER
+
+def count(name, amount=1):
+    #Add to a counter of the current sheet; a no-op when no sheet is being timed.
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings.count(name, amount)
+
+class BatchProfile:
+    #Per-sheet stage timings and counters aggregated over a batch, reported as p50/p95/p99 per stage.
+    def __init__(self):
+        self.stage_samples = {}
+        self.counter_samples = {}
+        self.sheet_count = 0
+        self.started = time.perf_counter()
+
+    def add(self, timings):
+        #Add the timings dict of one sheet.
+        self.sheet_count += 1
+        for name, seconds in timings["stages"].items():
+            self.stage_samples.setdefault(name, []).append(seconds)
+        for name, value in timings["counters"].items():
+            self.counter_samples.setdefault(name, []).append(value)
+
+    def record(self, name, seconds):
+        #Add one sample to a stage timed outside the sheet, such as writing results.
+        self.stage_samples.setdefault(name, []).append(seconds)
+
+    def summary(self):
+        #Return one row per stage (milliseconds) and per counter, with count, mean, p50, p95, p99 and max.
+        rows = []
+        for kind, samples_by_name, scale in (("stage", self.stage_samples, 1000.0), ("counter", self.counter_samples, 1.0)):
+            for name, samples in samples_by_name.items():
+                values = np.asarray(samples, dtype=np.float64) * scale
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                rows.append({
+                    "kind": kind,
+                    "name": name,
+                    "count": len(values),
+                    "total": round(float(values.sum()), 3),
+                    "mean": round(float(values.mean()), 3),
+                    "p50": round(float(p50), 3),
+                    "p95": round(float(p95), 3),
+                    "p99": round(float(p99), 3),
+                    "max": round(float(values.max()), 3),
+                })
+        return rows
+
+    def export(self, path):
+        #Write the summary as JSON or CSV, chosen by the file extension.
+        rows = self.summary()
+        elapsed = time.perf_counter() - self.started
+        if os.path.splitext(path)[1].lower() == ".csv":
+            with open(path, "w", newline="", encoding="utf-8") as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=["kind", "name", "count", "total", "mean", "p50", "p95", "p99", "max"])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            profile = {
+                "sheets": self.sheet_count,
+                "elapsed_seconds": round(elapsed, 3),
+                "sheets_per_second": round(self.sheet_count / elapsed, 3) if elapsed > 0 else None,
+                "stage_unit": "ms",
+                "stages": [row for row in rows if row["kind"] == "stage"],
+                "counters": [row for row in rows if row["kind"] == "counter"],
+            }
+            with open(path, "w", encoding="utf-8") as json_file:
+                json.dump(profile, json_file, indent=2)
+        print(f"Profile for {self.sheet_count} sheet(s) saved to {path}")
+
+    def report(self):
+        #Print the per-stage latencies as a table.
+        print(f"{'stage':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for row in self.summary():
+            if row["kind"] == "stage":
+                print(f"{row['name']:<16}{row['count']:>7}{row['p50']:>10.2f}{row['p95']:>10.2f}{row['p99']:>10.2f}{row['max']:>10.2f}")
@@ -0,0 +1,88 @@
+import json
+import re
+
+# Option letters of a generated question, matching the bubbles on the OMR sheet
+OPTION_LETTERS = ("A", "B", "C", "D")
+
+QUESTION_LINE = re.compile(r"^\s*(\d+)[.)]\s*(.*)$")
+OPTION_LINE = re.compile(r"^\s*([A-Da-d])[.)]\s*(.*)$")
+
+def validate_mcq_item(item):
+    #Check one generated question against the schema; returns the list of problems, empty when valid.
+    if not isinstance(item, dict):
+        return ["item is not an object"]
+    errors = []
+    question = item.get("question")
+    if not isinstance(question, str) or not question.strip():
+        errors.append("question must be a non-empty string")
+    options = item.get("options")
+    if not isinstance(options, dict) or sorted(options) != sorted(OPTION_LETTERS):
+        errors.append(f"options must have exactly the keys {', '.join(OPTION_LETTERS)}")
+    elif not all(isinstance(text, str) and text.strip() for text in options.values()):
+        errors.append("every option must be a non-empty string")
+    elif len({text.strip().lower() for text in options.values()}) < len(OPTION_LETTERS):
+        errors.append("options must be distinct")
+    if item.get("answer") not in OPTION_LETTERS:
+        errors.append(f"answer must be one of {', '.join(OPTION_LETTERS)}")
+    extra_keys = set(item) - {"question", "options", "answer"}
+    if extra_keys:
+        errors.append(f"unexpected keys: {', '.join(sorted(extra_keys))}")
+    return errors
+
+def mcqs_from_items(items):
+    #Turn validated question items into the (mcqs, answers, question_no_answer) lists used by the outputs.
+    mcqs, answers, question_no_answer = [], [], []
+    for question_no, item in enumerate(items, start=1):
+        mcqs.append(f"{question_no}. {item['question'].strip()}")
+        mcqs.extend(f"{letter}) {item['options'][letter].strip()}" for letter in OPTION_LETTERS)
+        answers.append(f"{question_no}. {item['answer']}) {item['options'][item['answer']].strip()}")
+        question_no_answer.append((question_no, item["answer"]))
+    return mcqs, answers, question_no_answer
+
+def items_from_question_bank(mcqs, question_no_answer):
+    #Parse generated MCQ lines and (question_no, answer) pairs back into question items.
+    # Works on the output of both generation modes: "1. Question" lines followed by "A) option" lines.
+    answers = {int(question_no): str(answer).strip()[:1].upper() for question_no, answer in question_no_answer}
+    items, item = [], None
+    for line in "\n".join(mcqs).split("\n"):
+        if not line.strip():
+            continue
+        question_match = QUESTION_LINE.match(line)
+        option_match = OPTION_LINE.match(line)
+        if question_match:
+            item = {"question_no": int(question_match.group(1)), "question": question_match.group(2), "options": {}}
+            items.append(item)
+        elif option_match and item is not None:
+            item["options"][option_match.group(1).upper()] = option_match.group(2)
+        elif item is not None:
+            # Continuation of a wrapped question or option
+            if item["options"]:
+                last_letter = list(item["options"])[-1]
+                item["options"][last_letter] += " " + line.strip()
+            else:
+                item["question"] += " " + line.strip()
+    for item in items:
+        if sorted(item["options"]) != list(OPTION_LETTERS):
+            raise ValueError(f"Question {item['question_no']} does not have options {', '.join(OPTION_LETTERS)}")
+        if answers.get(item["question_no"]) not in OPTION_LETTERS:
+            raise ValueError(f"Question {item['question_no']} has no answer among {', '.join(OPTION_LETTERS)}")
+        item["answer"] = answers[item.pop("question_no")]
+    return items
+
+def save_question_bank(items, path):
+    #Write question items to a JSON question bank, so papers can be re-rendered without calling the model.
+    with open(path, "w", encoding="utf-8") as bank_file:
+        json.dump({"questions": items}, bank_file, indent=2, ensure_ascii=False)
+
+def load_question_bank(path):
+    #Read and validate the question items of a JSON question bank.
+    with open(path, "r", encoding="utf-8") as bank_file:
+        payload = json.load(bank_file)
+    items = payload.get("questions") if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise ValueError(f"{path} has no questions")
+    for question_no, item in enumerate(items, start=1):
+        errors = validate_mcq_item(item)
+        if errors:
+            raise ValueError(f"Question {question_no} in {path}: {'; '.join(errors)}")
+    return items
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+
+# Default results database, shared by every grading run
+DEFAULT_RESULTS_PATH = "omr_results.sqlite"
+
+# Summary row keys -> sheets table columns
+SHEET_COLUMNS = {
+    "Roll Number": "roll_number",
+    "Total Marks": "total_marks",
+    "Obtained Marks": "obtained_marks",
+    "Thresholds": "thresholds",
+    "Variant": "variant",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    run_id TEXT NOT NULL,
+    sheet_no INTEGER NOT NULL,
+    graded_at TEXT NOT NULL,
+    image_path TEXT,
+    answers_path TEXT,
+    PRIMARY KEY (run_id, sheet_no)
+);
+CREATE TABLE IF NOT EXISTS answers (
+    run_id TEXT NOT NULL,
+    sheet_no INTEGER NOT NULL,
+    question_no INTEGER NOT NULL,
+    correct_answer TEXT,
+    detected_answer TEXT,
+    is_correct INTEGER NOT NULL,
+    PRIMARY KEY (run_id, sheet_no, question_no)
+);
+CREATE TABLE IF NOT EXISTS failures (
+    run_id TEXT NOT NULL,
+    failed_at TEXT NOT NULL,
+    image_path TEXT,
+    answers_path TEXT,
+    error TEXT
+);
+"""
+
+def new_run_id():
+    #Return an id unique to one grading run, even for runs started in the same second.
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+class ResultsStore:
+    #Append-only SQLite store for per-sheet and per-question results of every grading run.
+    # Rows are buffered and written in one transaction once batch_size sheets are pending or flush_interval
+    # seconds have passed, so a batch costs a handful of commits rather than a file per sheet. SQLite's
+    # write-ahead log makes each commit atomic: after a crash the store holds every committed batch and nothing partial.
+    def __init__(self, path=DEFAULT_RESULTS_PATH, batch_size=200, flush_interval=5.0, run_id=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.run_id = run_id or new_run_id()
+        self.sheet_count = 0
+        # Callers sharing one store across threads, like the grading service, serialize access themselves
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._add_missing_columns()
+        self._pending_sheets = []
+        self._pending_answers = []
+        self._pending_failures = []
+        self._last_flush = time.monotonic()
+
+    def _add_missing_columns(self):
+        #Add summary columns introduced since the database was created.
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(sheets)")}
+        for column in SHEET_COLUMNS.values():
+            if column not in existing:
+                self.connection.execute(f"ALTER TABLE sheets ADD COLUMN {column}")
+        self.connection.commit()
+
+    def add_sheet(self, summary, answer_rows, image_path=None, answers_path=None):
+        #Queue one graded sheet: its summary row and per-question rows. Returns True if this triggered a commit.
+        self.sheet_count += 1
+        row = {
+            "run_id": self.run_id,
+            "sheet_no": self.sheet_count,
+            "graded_at": datetime.now().isoformat(timespec="seconds"),
+            "image_path": image_path,
+            "answers_path": answers_path,
+        }
+        for key, column in SHEET_COLUMNS.items():
+            row[column] = summary.get(key)
+        self._pending_sheets.append(row)
+        for answer in answer_rows:
+            self._pending_answers.append((
+                self.run_id, self.sheet_count, int(answer["question_no"]),
+                _text(answer["correct_answer"]), _text(answer["detected_answer"]), int(answer["is_correct"]),
+            ))
+        return self.flush_if_due()
+
+    def add_failure(self, image_path, answers_path, error):
+        #Queue a sheet that could not be graded. Returns True if this triggered a commit.
+        self._pending_failures.append((self.run_id, datetime.now().isoformat(timespec="seconds"), image_path, answers_path, error))
+        return self.flush_if_due()
+
+    def flush_if_due(self):
+        #Commit pending rows if the batch is full or the flush interval has passed.
+        pending = len(self._pending_sheets) + len(self._pending_failures)
+        if pending >= self.batch_size or (pending and time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        #Write every pending row in a single transaction.
+        if self._pending_sheets:
+            columns = list(self._pending_sheets[0])
+            placeholders = ", ".join(f":{column}" for column in columns)
+            sheets_sql = f"INSERT INTO sheets ({', '.join(columns)}) VALUES ({placeholders})"
+        with self.connection:  # Commits on success, rolls back on error
+            if self._pending_sheets:
+                self.connection.executemany(sheets_sql, self._pending_sheets)
+            self.connection.executemany("INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?)", self._pending_answers)
+            self.connection.executemany("INSERT INTO failures VALUES (?, ?, ?, ?, ?)", self._pending_failures)
+        self._pending_sheets = []
+        self._pending_answers = []
+        self._pending_failures = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        #Commit anything pending and close the database.
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _text(value):
+    #Store answers as text; a missing key entry is stored as NULL.
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return str(value)
+
+def read_results(path=DEFAULT_RESULTS_PATH, table="sheets", run_id=None):
+    #Load one table of the results store into a DataFrame, optionally for a single run.
+    import pandas as pd
+    if table not in ("sheets", "answers", "failures"):
+        raise ValueError("Invalid table. Use 'sheets', 'answers' or 'failures'.")
+    if not os.path.exists(path):
+        raise ValueError(f"Results store not found: {path}")
+    connection = sqlite3.connect(path)
+    try:
+        if run_id is None:
+            return pd.read_sql_query(f"SELECT * FROM {table}", connection)
+        return pd.read_sql_query(f"SELECT * FROM {table} WHERE run_id = ?", connection, params=(run_id,))
+    finally:
+        connection.close()
@@ -0,0 +1,99 @@
+import json
+import os
+import numpy as np
+
+# Layout templates shipped with the project
+LAYOUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "layouts")
+DEFAULT_LAYOUT_PATH = os.path.join(LAYOUTS_DIR, "omr_30.json")
+# The 30-question sheet with a two-digit exam variant column, for shuffled papers
+VARIANT_LAYOUT_PATH = os.path.join(LAYOUTS_DIR, "omr_30_variants.json")
+
+def compile_interval_lookup(intervals, size):
+    #Map every pixel position to the index of the first interval (start, end inclusive) containing it, or -1.
+    lookup = np.full(size, -1, dtype=np.int32)
+    for index in reversed(range(len(intervals))):  # Earlier intervals win, as in a first-match scan
+        start, end = intervals[index]
+        lookup[max(start, 0):min(end + 1, size)] = index
+    return lookup
+
+def compile_roll_lookups(column_x_coordinates, row_y_coordinates, width=0, height=0):
+    #Compile roll number grid lines into (x -> column, y -> row) lookups.
+    # Columns span [x_i, x_i+1); a row matches when within half a row pitch of its centre.
+    columns = [(start, end - 1) for start, end in zip(column_x_coordinates, column_x_coordinates[1:])]
+    column_lookup = compile_interval_lookup(columns, max(width, column_x_coordinates[-1]) + 1)
+    half_pitch = (row_y_coordinates[1] - row_y_coordinates[0]) // 2
+    rows = [(row_y - half_pitch, row_y + half_pitch) for row_y in row_y_coordinates]
+    row_lookup = compile_interval_lookup(rows, max(height, row_y_coordinates[-1] + half_pitch) + 1)
+    return column_lookup, row_lookup
+
+def compile_option_lookup(column_ranges, width=0):
+    #Compile option column ranges (inclusive) into an x -> option index lookup.
+    size = max([width] + [end for _, end in column_ranges.values()]) + 1
+    return compile_interval_lookup(list(column_ranges.values()), size)
+
+def lookup_index(lookup, position):
+    #Return the lookup entry for a pixel position, or -1 outside the compiled range.
+    return int(lookup[position]) if 0 <= position < len(lookup) else -1
+
+class RollNumberLayout:
+    #Roll number grid compiled into x -> digit column and y -> digit value lookups.
+    # Also used for the exam variant field, which is read the same way.
+    def __init__(self, spec):
+        self.coordinates = tuple(spec["coordinates"])
+        self.threshold = spec["threshold"]
+        self.detection = dict(spec["detection"])
+        self.column_x_coordinates = list(spec["column_x_coordinates"])
+        self.row_y_coordinates = list(spec["row_y_coordinates"])
+        self.fixed_columns = {int(column): value for column, value in spec.get("fixed_columns", {}).items()}
+        x1, y1, x2, y2 = self.coordinates
+        self.column_lookup, self.row_lookup = compile_roll_lookups(self.column_x_coordinates, self.row_y_coordinates, x2 - x1, y2 - y1)
+
+    @property
+    def digit_count(self):
+        return len(self.column_x_coordinates) - 1 - len(self.fixed_columns)
+
+class QuestionBoxLayout:
+    #Question box compiled into an x -> option lookup.
+    def __init__(self, spec):
+        self.coordinates = tuple(spec["coordinates"])
+        self.threshold = spec["threshold"]
+        self.detection = dict(spec["detection"])
+        self.total_rows = spec["rows"]
+        self.start_question = spec["start_question"]
+        self.column_ranges = {option: tuple(bounds) for option, bounds in spec["column_ranges"].items()}
+        self.options = list(self.column_ranges)
+        x1, _, x2, _ = self.coordinates
+        self.option_lookup = compile_option_lookup(self.column_ranges, x2 - x1)
+
+class SheetLayout:
+    #A sheet layout template compiled once into per-pixel lookup tables.
+    def __init__(self, spec):
+        self.name = spec.get("name", "custom")
+        self.fill_ratio_threshold = spec.get("fill_ratio_threshold", 0.7)
+        self.registration = spec.get("registration")  # Reference corners of the printed content, if any
+        self.roll_number = RollNumberLayout(spec["roll_number"])
+        self.variant = RollNumberLayout(spec["variant"]) if spec.get("variant") else None  # Optional exam variant digits
+        self.question_boxes = [QuestionBoxLayout(box) for box in spec["question_boxes"]]
+
+    @property
+    def region_coordinates(self):
+        #Coordinates of every region read from the sheet.
+        coordinates = [self.roll_number.coordinates] + [box.coordinates for box in self.question_boxes]
+        if self.variant is not None:
+            coordinates.append(self.variant.coordinates)
+        return coordinates
+
+    @property
+    def question_count(self):
+        return sum(box.total_rows for box in self.question_boxes)
+
+# Compiled layouts keyed by absolute path
+_layout_cache = {}
+
+def load_layout(layout_path=None):
+    #Load and compile a JSON layout template, once per path. Defaults to the 30-question sheet.
+    layout_path = os.path.abspath(layout_path or DEFAULT_LAYOUT_PATH)
+    if layout_path not in _layout_cache:
+        with open(layout_path, "r", encoding="utf-8") as layout_file:
+            _layout_cache[layout_path] = SheetLayout(json.load(layout_file))
+    return _layout_cache[layout_path]
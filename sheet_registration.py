@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+
+def find_content_corners(image, downsample=0.5, min_area_fraction=0.002, content_threshold=200):
+    #Locate the printed content of a sheet on a downsampled copy and return its four corners in full resolution.
+    # Anything darker than content_threshold is ink; a high value keeps thin grid lines connected after
+    # downsampling. Only large external contours (the printed boxes and grids) count, so titles, specks and
+    # stray pen lines do not move the corners. Corners are ordered top-left, top-right, bottom-right, bottom-left.
+    small = cv2.resize(image, None, fx=downsample, fy=downsample, interpolation=cv2.INTER_AREA)
+    _, thresholded = cv2.threshold(small, content_threshold, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_area_fraction * small.shape[0] * small.shape[1]
+    large_contours = [contour for contour in contours if cv2.contourArea(contour) >= min_area]
+    if not large_contours:
+        return None
+    points = np.vstack(large_contours).reshape(-1, 2).astype(np.float32)
+    box = cv2.boxPoints(cv2.minAreaRect(points)) / downsample
+    sums = box.sum(axis=1)
+    differences = box[:, 1] - box[:, 0]
+    return np.array([box[sums.argmin()], box[differences.argmin()], box[sums.argmax()], box[differences.argmax()]], dtype=np.float32)
+
+def estimate_registration(image, registration):
+    #Return the 2x3 affine matrix mapping the scanned sheet onto the layout's reference frame.
+    # Returns None when the sheet is already aligned within the tolerance or when no usable content is found.
+    corners = find_content_corners(image, registration["downsample"], registration["min_area_fraction"], registration["content_threshold"])
+    if corners is None:
+        print("Warning: sheet registration found no printed content; using the scan as is.")
+        return None
+    reference_corners = np.asarray(registration["reference_corners"], dtype=np.float32)
+    if np.abs(corners - reference_corners).max() <= registration["tolerance_pixels"]:
+        return None
+    matrix, _ = cv2.estimateAffinePartial2D(corners, reference_corners)
+    if matrix is None:
+        print("Warning: sheet registration could not fit a transform; using the scan as is.")
+        return None
+    scale = float(np.hypot(matrix[0, 0], matrix[1, 0]))
+    if not registration["min_scale"] <= scale <= registration["max_scale"]:
+        print(f"Warning: sheet registration rejected an implausible scale of {scale:.2f}; using the scan as is.")
+        return None
+    return matrix
+
+def warp_regions(image, matrix, regions):
+    #Warp only the given (x1, y1, x2, y2) regions of the reference frame, leaving the rest of the sheet blank.
+    registered = np.full_like(image, 255)
+    height, width = image.shape[:2]
+    for x1, y1, x2, y2 in regions:
+        x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, width), min(y2, height)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        region_matrix = matrix.copy()
+        region_matrix[:, 2] -= (x1, y1)  # Shift the output origin to the region's corner
+        registered[y1:y2, x1:x2] = cv2.warpAffine(
+            image, region_matrix, (x2 - x1, y2 - y1), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=255
+        )
+    return registered
@@ -0,0 +1,68 @@
+import re
+
+# Page separator inserted between pages by extract_text_from_pdf
+PAGE_BREAK = "\f"
+
+# Rough characters per token for English text; avoids shipping a tokenizer
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _split_oversized(unit, max_chars):
+    #Split a unit longer than max_chars on blank lines, then lines, then sentences, then hard cuts.
+    for separator in (r"\n\s*\n", r"\n", r"(?<=[.!?])\s+"):
+        parts = [part for part in re.split(separator, unit) if part.strip()]
+        if len(parts) > 1:
+            pieces = []
+            for part in parts:
+                pieces.extend(_split_oversized(part, max_chars) if len(part) > max_chars else [part])
+            return pieces
+    return [unit[start:start + max_chars] for start in range(0, len(unit), max_chars)]
+
+def iter_chunks(pages, max_tokens=4000):
+    #Yield chunks of at most max_tokens (estimated) from an iterable of page texts, as soon as each chunk fills.
+    # Whole pages are packed together while they fit; a page larger than the budget is split on
+    # paragraphs, then lines, then sentences. Callers holding only a page stream (e.g. from iter_pdf_pages)
+    # can chunk as pages arrive. MCQ generation chunks the cached whole-document text instead, since it
+    # needs every chunk's length to share out the questions before the first request is sent.
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    current, current_length = [], 0
+    for page in pages:
+        if not page.strip():
+            continue
+        for unit in _split_oversized(page, max_chars) if len(page) > max_chars else [page]:
+            if current and current_length + len(unit) + 1 > max_chars:
+                yield "\n".join(current)
+                current, current_length = [], 0
+            current.append(unit)
+            current_length += len(unit) + 1
+    if current:
+        yield "\n".join(current)
+
+def chunk_text(text, max_tokens=4000):
+    #Split text into chunks of at most max_tokens (estimated), breaking on page and section boundaries.
+    # Returns the non-empty chunks in document order.
+    return list(iter_chunks(text.split(PAGE_BREAK), max_tokens))
+
+def allocate_questions(chunks, total):
+    #Split a question count over chunks in proportion to their length, so questions cover the whole text.
+    # Every chunk asks for at least one question; with more chunks than questions, evenly spaced chunks are used.
+    # Returns one count per chunk, 0 for chunks that are skipped.
+    counts = [0] * len(chunks)
+    if not chunks or total <= 0:
+        return counts
+    if len(chunks) >= total:
+        step = len(chunks) / total
+        for index in range(total):
+            counts[int(index * step + step / 2)] = 1
+        return counts
+    lengths = [len(chunk) for chunk in chunks]
+    spare = total - len(chunks)
+    shares = [spare * length / sum(lengths) for length in lengths]
+    counts = [1 + int(share) for share in shares]
+    # Hand out what rounding down left over to the largest remainders
+    by_remainder = sorted(range(len(chunks)), key=lambda index: shares[index] - int(shares[index]), reverse=True)
+    for index in by_remainder[:total - sum(counts)]:
+        counts[index] += 1
+    return counts